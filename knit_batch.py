@@ -0,0 +1,153 @@
+"""
+Knit Anemia Route Optimisation - Batch Solve
+Description :
+    solves every scenario of a manifest on a process pool and writes one consolidated result set
+    each matrix csv is parsed once, by this process, into its .npy sidecar (see knit_data.load_matrix),
+    the workers memory map the sidecar so scenarios sharing a matrix share the same pages instead of
+    reloading it, and keep it mapped for their next scenarios
+Manifest :
+    {"time_limit_ms": 30000,
+     "scenarios": [{"name": "block-a", "demands": "test_demands1.csv", "matrix": "travel_times.csv",
+                    "capacity": 12000, "demand_column": 5, "time_windows": [[0, 12000], ...],
+                    "start_locations": [2, 0, ...], "end_locations": [0, 0, ...],
+                    "fleet": "fleet.csv", "time_limit_ms": 10000}]}
+    demands, matrix and capacity are required, the other fields are optional,
+    a fleet file (see knit_fleet) replaces the capacity by mixed vehicle classes
+Usage :
+    python knit_batch.py manifest.json [--output=results.json|.csv] [--workers=N] [--time-limit=MS]
+Errors :
+    a failing scenario is reported with its error in the results, the other scenarios still run
+"""
+from __future__ import print_function
+import csv
+import io
+import json
+import multiprocessing
+import sys
+import time
+from knit_bounds import gap, lower_bounds
+from knit_data import load_demands, load_matrix
+from knit_engine import CreateTimeEvaluator, DataProblem, command_line_value, model_builder
+from knit_engine import search_parameters
+from knit_fleet import load_fleet
+
+
+RESULTS_FILE = 'batch_results.json'
+TIME_LIMIT_MS = 30000
+SUMMARY_FIELDS = ['name', 'capacity', 'cost', 'vehicles', 'dedicated', 'gap', 'elapsed', 'error']
+
+
+############
+# Manifest #
+############
+def load_manifest(path):
+    """Reads the scenarios of a manifest, each with its name and time limit"""
+    with io.open(path) as f:
+        manifest = json.load(f)
+    scenarios = []
+    for position, scenario in enumerate(manifest['scenarios']):
+        for field in ('demands', 'matrix', 'capacity'):
+            if field not in scenario:
+                raise ValueError('scenario {0} of {1} has no {2}'.format(position, path, field))
+        scenario = dict(scenario)
+        scenario.setdefault('name', str(position))
+        scenario.setdefault('time_limit_ms', manifest.get('time_limit_ms', TIME_LIMIT_MS))
+        scenarios.append(scenario)
+    return scenarios
+
+
+##########
+# Worker #
+##########
+_matrices = {}
+
+
+def matrix(path):
+    """Gets a travel time matrix, memory mapped once per worker"""
+    if path not in _matrices:
+        _matrices[path] = load_matrix(path)
+    return _matrices[path]
+
+
+def solve_scenario(scenario):
+    """Solves one scenario in a worker process, returns its result"""
+    start = time.time()
+    result = {'name': scenario['name'], 'capacity': scenario['capacity']}
+    try:
+        from knit_solver import extract_routes, solve_with_growing_fleet
+        data = DataProblem(load_demands(scenario['demands'], scenario.get('demand_column', 5)),
+                           matrix(scenario['matrix']), scenario['capacity'],
+                           scenario.get('time_windows'), scenario.get('start_locations'),
+                           scenario.get('end_locations'),
+                           fleet=load_fleet(scenario['fleet']) if 'fleet' in scenario else None)
+        data.formulator()
+        time_evaluator = CreateTimeEvaluator(data)
+        routing, assignment = solve_with_growing_fleet(
+            data, model_builder(data, time_evaluator=time_evaluator),
+            search_parameters(scenario['time_limit_ms']), total_time=time_evaluator.total_time)
+        result['dedicated'] = [{'vehicle': int(route['vehicle']), 'village': int(route['village']),
+                                'load': int(route['load'])} for route in data.dedicated_routes]
+        if assignment is None:
+            result.update(routes=None, cost=None, vehicles=None)
+        else:
+            routes = [route for route in extract_routes(routing, assignment) if route]
+            # without the villages the time windows rule out, as the model
+            bound = lower_bounds(data, time_evaluator.total_time, time_evaluator.pruning(data)).cost
+            result.update(routes=routes, cost=assignment.ObjectiveValue(),
+                          vehicles=data.req_vehicles + len(routes), bound=bound,
+                          gap=round(gap(assignment.ObjectiveValue(), bound), 4))
+    except Exception as error:  # pylint: disable=broad-except
+        # one failing scenario does not stop the batch
+        result['error'] = '{0}: {1}'.format(type(error).__name__, error)
+    result['elapsed'] = round(time.time() - start, 3)
+    return result
+
+
+#########
+# Batch #
+#########
+def solve_batch(scenarios, processes=None):
+    """Solves every scenario on a process pool, returns the results in manifest order"""
+    # parse each matrix csv once so the workers only map its sidecar
+    for path in sorted(set(scenario['matrix'] for scenario in scenarios)):
+        load_matrix(path)
+    pool = multiprocessing.Pool(processes or min(len(scenarios), multiprocessing.cpu_count()) or 1)
+    try:
+        results = []
+        for result in pool.imap(solve_scenario, scenarios):
+            print('{name} : cost {0}, {1} vehicles, {elapsed}s{2}'.format(
+                result.get('cost'), result.get('vehicles'),
+                ' ({0})'.format(result['error']) if 'error' in result else '', **result))
+            results.append(result)
+    finally:
+        pool.terminate()
+    return results
+
+
+def write_results(path, results):
+    """Writes every result as json, or one summary row per scenario when the path ends with .csv"""
+    if path.endswith('.csv'):
+        with io.open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, SUMMARY_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            for result in results:
+                writer.writerow(dict(result, dedicated=len(result.get('dedicated', []))))
+    else:
+        with io.open(path, 'w') as f:
+            f.write(json.dumps({'scenarios': results}))
+
+
+def main(argv):
+    """Solves the scenarios of the manifest given as first argument"""
+    scenarios = load_manifest(argv[0])
+    time_limit_ms = command_line_value('time-limit', None, argv)
+    if time_limit_ms:
+        for scenario in scenarios:
+            scenario['time_limit_ms'] = int(time_limit_ms)
+    workers = command_line_value('workers', None, argv)
+    results = solve_batch(scenarios, workers and int(workers))
+    write_results(command_line_value('output', RESULTS_FILE, argv), results)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
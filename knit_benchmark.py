@@ -0,0 +1,373 @@
+"""
+Knit Anemia Route Optimisation - Benchmarks
+Description :
+    matrix : build time and peak memory of the total time table,
+        dict of dicts (as CreateTimeEvaluator used to build it) against the numpy matrix engine
+    footprint : memory held by a problem and its total time table, nested lists, tuples and dict
+        of dicts (as the scripts used to store them) against the int32 arrays of knit_engine.DataProblem,
+        checked to be smaller
+    solve : model build time, solve time, objective, vehicles used and peak memory of every engine
+        variant on synthetic problems, each run in its own process, written to a json or csv report,
+        with the total time lower bound of knit_bounds and the gap of the objective to it
+    neighbours : the same records for the capacity variant with the arcs restricted to the k nearest
+        neighbours, with the solve time and objective change against the full model
+    fast : time, total time of the routes and vehicles of the numpy heuristic of knit_heuristic against
+        the ortools solve of the capacity variant, with the gap of its objective
+    whatif : a few village demands change after a solve, knit_warmstart.solve_what_if (incremental
+        update and warm re-solve) against a full rebuild (new problem, formulator, evaluator, model)
+        solved from scratch
+Usage :
+    python knit_benchmark.py matrix [sizes...]
+    python knit_benchmark.py footprint [sizes...]
+    python knit_benchmark.py solve [sizes...] [--time-limit=MS] [--seed=N] [--report=FILE.json|.csv]
+    python knit_benchmark.py neighbours [sizes...] [--time-limit=MS] [--seed=N] [--report=...]
+    python knit_benchmark.py fast [sizes...] [--time-limit=MS] [--seed=N]
+    python knit_benchmark.py whatif [sizes...] [--changes=N] [--time-limit=MS] [--seed=N]
+"""
+from __future__ import print_function
+from six.moves import xrange
+import csv
+import functools
+import io
+import json
+import multiprocessing
+import sys
+import timeit
+import tracemalloc
+import numpy as np
+from knit_engine import CreateTimeEvaluator, DataProblem, command_line_value, model_builder
+from knit_engine import search_parameters
+from knit_bounds import gap, lower_bounds
+from knit_matrix import total_time_matrix
+from knit_synthetic import CAPACITY, MAX_DEMAND, synthetic_problem, synthetic_start_problem
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# variant : synthetic problem with the options of the variant
+VARIANTS = {
+    'capacity': functools.partial(synthetic_problem, time_windows=False),
+    'time_windows': synthetic_problem,
+    'start_locations': functools.partial(synthetic_start_problem, time_windows=False),
+}
+SOLVE_SIZES = [10, 50, 100, 500, 1000, 2000, 5000]
+SOLVE_TIME_LIMIT_MS = 10000
+NEIGHBOURS = [5, 10, 20, 40]
+NEIGHBOUR_SIZES = [100, 500, 1000]
+FAST_SIZES = [100, 500, 1000, 2000]
+WHAT_IF_SIZES = [100, 500, 1000]
+WHAT_IF_CHANGES = 5
+REPORT_FIELDS = ['variant', 'size', 'seed', 'neighbours', 'build_s', 'solve_s', 'objective',
+                 'vehicles', 'bound', 'gap', 'peak_mb']
+
+
+#####################
+# Synthetic inputs  #
+#####################
+def random_instance(num_locations, seed=0):
+    """Gets random demands and a random travel time matrix"""
+    rng = np.random.RandomState(seed)
+    demands = rng.randint(0, 8000, size=num_locations)
+    demands[0] = 0
+    distances = rng.randint(1, 3000, size=(num_locations, num_locations))
+    np.fill_diagonal(distances, 0)
+    return demands.tolist(), distances.tolist()
+
+
+##############
+# Candidates #
+##############
+def dict_total_time(demands, distances):
+    """Builds the total time table the way CreateTimeEvaluator used to"""
+    total_time = {}
+    for from_node in xrange(len(demands)):
+        total_time[from_node] = {}
+        for to_node in xrange(len(demands)):
+            if from_node == to_node:
+                total_time[from_node][to_node] = 0
+            else:
+                total_time[from_node][to_node] = int(
+                    demands[from_node] + distances[from_node][to_node])
+    return total_time
+
+
+def measure(builder, *args):
+    """Returns (seconds, peak bytes) for one call of the builder"""
+    tracemalloc.start()
+    start = timeit.default_timer()
+    result = builder(*args)
+    elapsed = timeit.default_timer() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return elapsed, peak
+
+
+def bench_total_time(sizes):
+    """Prints build time and memory of both total time tables for each size"""
+    print('{0:>6} {1:>12} {2:>12} {3:>12} {4:>12}'.format(
+        'n', 'dict s', 'dict MB', 'numpy s', 'numpy MB'))
+    for size in sizes:
+        demands, distances = random_instance(size)
+        if size <= 200:
+            # both tables must agree cell for cell
+            expected = dict_total_time(demands, distances)
+            assert (total_time_matrix(demands, distances) ==
+                    [[expected[i][j] for j in xrange(size)] for i in xrange(size)]).all()
+        dict_time, dict_peak = measure(dict_total_time, demands, distances)
+        numpy_time, numpy_peak = measure(total_time_matrix, demands, distances)
+        print('{0:>6} {1:>12.3f} {2:>12.1f} {3:>12.3f} {4:>12.1f}'.format(
+            size, dict_time, dict_peak / 1e6, numpy_time, numpy_peak / 1e6))
+
+
+#############
+# Footprint #
+#############
+class ListProblem(object):
+    """Stores the data the way the scripts used to, in nested lists and tuples"""
+    def __init__(self, demands, distances, time_windows):
+        """Initializes the data for the problem"""
+        self._demands = demands
+        self._distances = distances
+        self._time_windows = [tuple(window) for window in time_windows]
+
+    @property
+    def demands(self):
+        """Gets demands at each location"""
+        return self._demands
+
+    @property
+    def distances(self):
+        """Gets distance between each pair of locations"""
+        return self._distances
+
+
+def list_problem(demands, distances, time_windows):
+    """Gets a list problem and the dict of dicts total time table its evaluator used to keep"""
+    data = ListProblem(demands.tolist(), distances.tolist(), time_windows.tolist())
+    return data, dict_total_time(data.demands, data.distances)
+
+
+def compact_problem(demands, distances, time_windows):
+    """Gets a compact problem and its time evaluator"""
+    data = DataProblem(demands, distances, CAPACITY, time_windows)
+    return data, CreateTimeEvaluator(data)
+
+
+def retained(builder, *args):
+    """Gets the bytes still allocated by the builder while its result is alive"""
+    tracemalloc.start()
+    result = builder(*args)
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return held
+
+
+def bench_footprint(sizes):
+    """Prints the memory held by both problem layouts for each size"""
+    print('{0:>6} {1:>12} {2:>12} {3:>8}'.format('n', 'lists MB', 'compact MB', 'ratio'))
+    for size in sizes:
+        demands, distances = (np.array(values) for values in random_instance(size))
+        opens = np.random.RandomState(size).randint(0, CAPACITY // 2, size)
+        time_windows = np.stack([opens, opens + CAPACITY // 2], axis=1)
+        lists = retained(list_problem, demands, distances, time_windows)
+        compact = retained(compact_problem, demands, distances, time_windows)
+        assert compact < lists, 'the compact problem holds more memory than the lists'
+        print('{0:>6} {1:>12.2f} {2:>12.2f} {3:>8.1f}'.format(
+            size, lists / 1e6, compact / 1e6, float(lists) / compact))
+
+
+#########
+# Solve #
+#########
+def peak_memory_mb():
+    """Gets the peak resident memory of this process, None where it cannot be measured"""
+    if resource is None:
+        return None
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_variant(variant, size, seed, time_limit_ms, num_neighbours=None):
+    """Builds and solves one synthetic problem, returns its record"""
+    from knit_solver import extract_routes, fleet_lower_bound
+    data = VARIANTS[variant](size, seed)
+    data.formulator()
+    parameters = search_parameters(time_limit_ms)
+    build_s = solve_s = 0.0
+    num_vehicles = min(max(1, fleet_lower_bound(data)), data.num_vehicles)
+    while True:
+        start = timeit.default_timer()
+        routing = model_builder(data, num_neighbours=num_neighbours)(num_vehicles)
+        build_s += timeit.default_timer() - start
+        start = timeit.default_timer()
+        assignment = routing.SolveWithParameters(parameters)
+        solve_s += timeit.default_timer() - start
+        if assignment is not None or num_vehicles >= data.num_vehicles:
+            break
+        num_vehicles += 1
+    # bound without the villages the time windows rule out, as the model
+    time_evaluator = CreateTimeEvaluator(data)
+    bound = lower_bounds(data, time_evaluator.total_time, time_evaluator.pruning(data)).cost
+    record = {'variant': variant, 'size': size, 'seed': seed, 'neighbours': num_neighbours,
+              'build_s': round(build_s, 4), 'solve_s': round(solve_s, 4),
+              'objective': None, 'vehicles': None, 'bound': bound, 'gap': None,
+              'peak_mb': peak_memory_mb()}
+    if assignment is not None:
+        record['objective'] = assignment.ObjectiveValue()
+        record['gap'] = round(gap(record['objective'], record['bound']), 4)
+        record['vehicles'] = data.req_vehicles + sum(
+            1 for route in extract_routes(routing, assignment) if route)
+    return record
+
+
+def run_isolated(*args):
+    """Runs one variant in a fresh process so the peak memory is its own, prints its record"""
+    pool = multiprocessing.Pool(1)
+    try:
+        record = pool.apply(run_variant, args)
+    finally:
+        pool.terminate()
+    print(' '.join('{0}={1}'.format(field, record[field]) for field in REPORT_FIELDS))
+    return record
+
+
+def bench_solve(sizes, variants=None, seed=0, time_limit_ms=SOLVE_TIME_LIMIT_MS):
+    """Runs every variant on every size"""
+    return [run_isolated(variant, size, seed, time_limit_ms)
+            for size in sizes for variant in variants or sorted(VARIANTS)]
+
+
+def bench_neighbours(sizes, neighbours=None, seed=0, time_limit_ms=SOLVE_TIME_LIMIT_MS):
+    """Runs the capacity variant on the full model and on the nearest neighbour models"""
+    records = []
+    for size in sizes:
+        full = run_isolated('capacity', size, seed, time_limit_ms)
+        records.append(full)
+        for num_neighbours in neighbours or NEIGHBOURS:
+            record = run_isolated('capacity', size, seed, time_limit_ms, num_neighbours)
+            records.append(record)
+            if full['objective'] and record['objective'] is not None:
+                print('    k={0} : solve time x{1:.2f}, objective {2:+.2%}'.format(
+                    num_neighbours, record['solve_s'] / max(full['solve_s'], 1e-9),
+                    float(record['objective'] - full['objective']) / full['objective']))
+    return records
+
+
+def bench_fast(sizes, seed=0, time_limit_ms=SOLVE_TIME_LIMIT_MS):
+    """Solves the capacity variant with the fast heuristic and with ortools"""
+    from knit_heuristic import solve_fast
+    records = []
+    for size in sizes:
+        data = VARIANTS['capacity'](size, seed)
+        data.formulator()
+        start = timeit.default_timer()
+        solution = solve_fast(data)
+        solve_s = timeit.default_timer() - start
+        bound = lower_bounds(data).cost
+        record = {'variant': 'fast', 'size': size, 'seed': seed, 'neighbours': None, 'build_s': 0.0,
+                  'solve_s': round(solve_s, 4), 'objective': solution.cost,
+                  'vehicles': data.req_vehicles + len(solution.routes), 'bound': bound,
+                  'gap': round(gap(solution.cost, bound), 4), 'peak_mb': None}
+        print(' '.join('{0}={1}'.format(field, record[field]) for field in REPORT_FIELDS))
+        full = run_isolated('capacity', size, seed, time_limit_ms)
+        records.extend([record, full])
+        if full['objective']:
+            print('    fast : time x{0:.3f}, objective {1:+.2%}'.format(
+                record['solve_s'] / max(full['build_s'] + full['solve_s'], 1e-9),
+                float(record['objective'] - full['objective']) / full['objective']))
+    return records
+
+
+###########
+# What-if #
+###########
+def bench_what_if(sizes, changes=WHAT_IF_CHANGES, seed=0, time_limit_ms=SOLVE_TIME_LIMIT_MS):
+    """Changes a few demands after a solve, re-solves incrementally and from a full rebuild"""
+    from knit_solver import extract_routes, solve_with_growing_fleet
+    from knit_warmstart import solve_what_if
+    parameters = search_parameters(time_limit_ms)
+    records = []
+    for size in sizes:
+        rng = np.random.RandomState(seed + 1)
+        villages = rng.choice(np.arange(1, size), min(changes, size - 1), replace=False)
+        demands = dict(zip(villages.tolist(), rng.randint(10, 4 * MAX_DEMAND, villages.size).tolist()))
+        data = synthetic_problem(size, seed, time_windows=False)
+        data.formulator()
+        time_evaluator = CreateTimeEvaluator(data)
+        build = model_builder(data, time_evaluator=time_evaluator)
+        routing, assignment = solve_with_growing_fleet(data, build, parameters)
+        routes = [route for route in extract_routes(routing, assignment) if route]
+
+        start = timeit.default_timer()
+        routing, assignment = solve_what_if(data, time_evaluator, build, parameters, demands, routes)
+        records.append({'mode': 'incremental', 'size': size, 'changes': len(demands),
+                        'prep_s': None, 'solve_s': None,
+                        'total_s': round(timeit.default_timer() - start, 4),
+                        'objective': assignment and assignment.ObjectiveValue()})
+
+        start = timeit.default_timer()
+        data = synthetic_problem(size, seed, time_windows=False)
+        for village, demand in demands.items():
+            data.demands[village] = demand
+        data.formulator()
+        build = model_builder(data)
+        prep_s = timeit.default_timer() - start
+        routing, assignment = solve_with_growing_fleet(data, build, parameters)
+        total_s = timeit.default_timer() - start
+        records.append({'mode': 'rebuild', 'size': size, 'changes': len(demands),
+                        'prep_s': round(prep_s, 4), 'solve_s': round(total_s - prep_s, 4),
+                        'total_s': round(total_s, 4),
+                        'objective': assignment and assignment.ObjectiveValue()})
+        for record in records[-2:]:
+            print('{mode:>11} n={size} changes={changes} total={total_s}s (prep={prep_s}s '
+                  'solve={solve_s}s) objective={objective}'.format(**record))
+    return records
+
+
+def write_report(path, records):
+    """Writes the records as json, or as csv when the path ends with .csv"""
+    if path.endswith('.csv'):
+        with io.open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+    else:
+        with io.open(path, 'w') as f:
+            f.write(json.dumps(records, indent=1))
+
+
+def main(argv):
+    """Runs the benchmark named by the first argument"""
+    suite = argv[0] if argv else 'matrix'
+    sizes = [int(arg) for arg in argv[1:] if not arg.startswith('--')]
+    if suite == 'matrix':
+        bench_total_time(sizes or [100, 500, 1000, 2000])
+    elif suite == 'footprint':
+        bench_footprint(sizes or [100, 500, 1000, 2000])
+    elif suite in ('solve', 'neighbours', 'fast'):
+        bench, default_sizes = {'solve': (bench_solve, SOLVE_SIZES),
+                                'neighbours': (bench_neighbours, NEIGHBOUR_SIZES),
+                                'fast': (bench_fast, FAST_SIZES)}[suite]
+        records = bench(sizes or default_sizes,
+                        seed=int(command_line_value('seed', 0, argv)),
+                        time_limit_ms=int(command_line_value(
+                            'time-limit', SOLVE_TIME_LIMIT_MS, argv)))
+        report = command_line_value('report', None, argv)
+        if report:
+            write_report(report, records)
+    elif suite == 'whatif':
+        bench_what_if(sizes or WHAT_IF_SIZES,
+                      int(command_line_value('changes', WHAT_IF_CHANGES, argv)),
+                      seed=int(command_line_value('seed', 0, argv)),
+                      time_limit_ms=int(command_line_value('time-limit', SOLVE_TIME_LIMIT_MS, argv)))
+    else:
+        raise ValueError('unknown benchmark {0}'.format(suite))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,148 @@
+"""
+Knit Anemia Route Optimisation - Lower Bounds
+Description :
+    cheap lower bounds on a formulated problem, so the gap of a solve tells how much quality a faster
+    configuration gives up
+    vehicles : bin packing bound, every village adds at least its demand plus its cheapest outgoing
+    travel time to the Capacity dimension of the vehicle visiting it
+    total time : the routes leave every village once and enter it once, the depot once per vehicle,
+    so their cost is at least the row and column reduction bound of that assignment problem,
+    and, with a single depot, the minimum spanning tree of the cheaper direction of every arc plus
+    the cheapest return of every vehicle (the routes without their last arc span every location)
+    both are computed on the total time matrix the model costs arcs with (of the fastest vehicles
+    and the largest capacity for a mixed fleet, plus the cheapest fixed cost of every vehicle),
+    in vectorized passes
+Errors :
+    NONE
+"""
+from __future__ import print_function
+from collections import namedtuple
+import numpy as np
+from knit_matrix import total_time_matrix
+
+
+# cost of an arc no route can use, small enough to be summed without overflow
+UNUSABLE = np.iinfo(np.int64).max // 4
+
+Bounds = namedtuple('Bounds', ['vehicles', 'cost'])
+
+
+def terminals(data):
+    """Gets the locations vehicles start or end at"""
+    return (set(getattr(data, 'start_locations', None) or [data.depot]) |
+            set(getattr(data, 'end_locations', None) or [data.depot]))
+
+
+def served_villages(data, num_locations, exclude=None):
+    """Gets True for every village a route has to visit"""
+    villages = np.ones(num_locations, dtype=bool)
+    villages[list(terminals(data))] = False
+    if exclude is not None:
+        villages[np.asarray(exclude, dtype=np.intp)] = False
+    return villages
+
+
+def arc_costs(total_time, arcs=None, exclude=None):
+    """Gets the total time of every arc as int64, UNUSABLE for self arcs, ruled out arcs
+    and arcs from or to excluded villages"""
+    costs = np.array(total_time, dtype=np.int64)
+    if arcs is not None:
+        costs[~arcs] = UNUSABLE
+    if exclude is not None:
+        exclude = np.asarray(exclude, dtype=np.intp)
+        costs[exclude] = UNUSABLE
+        costs[:, exclude] = UNUSABLE
+    np.fill_diagonal(costs, UNUSABLE)
+    return costs
+
+
+def fleet_lower_bound(data, capacity=None, total_time=None, exclude=None):
+    """Gets a bin packing lower bound on the number of vehicles the optimizer needs"""
+    if capacity is None:
+        capacity = data.vehicle.capacity
+    if total_time is None:
+        total_time = total_time_matrix(data.demands, data.distances)
+    costs = arc_costs(total_time, exclude=exclude)
+    sizes = costs[served_villages(data, costs.shape[0], exclude)].min(axis=1)
+    if not sizes.size:
+        return 0
+    return int(max(-(-sizes.sum() // capacity), np.count_nonzero(2 * sizes > capacity)))
+
+
+def assignment_bound(costs, multiplicity):
+    """Gets the row and column reduction bound of the assignment problem where location i
+    is left and entered multiplicity[i] times"""
+    used = multiplicity > 0
+    rows = np.where(used, costs.min(axis=1), 0)
+    columns = np.where(used, (costs - rows[:, np.newaxis]).min(axis=0), 0)
+    return int(multiplicity.dot(rows) + multiplicity.dot(columns))
+
+
+def spanning_tree_cost(costs):
+    """Gets the cost of the minimum spanning tree of a symmetric matrix by Prim, None if disconnected"""
+    in_tree = np.zeros(costs.shape[0], dtype=bool)
+    in_tree[0] = True
+    best = costs[0].copy()
+    total = 0
+    for _ in range(costs.shape[0] - 1):
+        node = int(np.where(in_tree, UNUSABLE, best).argmin())
+        if best[node] >= UNUSABLE:
+            return None
+        total += int(best[node])
+        in_tree[node] = True
+        np.minimum(best, costs[node], out=best)
+    return total
+
+
+def cost_lower_bound(data, num_vehicles, total_time=None, arcs=None, exclude=None):
+    """Gets a lower bound on the total time of the routes of num_vehicles vehicles or more"""
+    if total_time is None:
+        total_time = total_time_matrix(data.demands, data.distances)
+    costs = arc_costs(total_time, arcs, exclude)
+    villages = served_villages(data, costs.shape[0], exclude)
+    if not villages.any():
+        return 0
+    multiplicity = villages.astype(np.int64)
+    single_depot = terminals(data) == {data.depot}
+    if single_depot:
+        multiplicity[data.depot] = num_vehicles
+    bound = assignment_bound(costs, multiplicity)
+    if single_depot:
+        locations = np.flatnonzero(villages | (np.arange(costs.shape[0]) == data.depot))
+        located = costs[np.ix_(locations, locations)]
+        tree = spanning_tree_cost(np.minimum(located, located.T))
+        if tree is not None:
+            returns = costs[villages, data.depot].min()
+            bound = max(bound, tree + num_vehicles * int(returns))
+    return bound
+
+
+def lower_bounds(data, total_time=None, pruning=None):
+    """Gets the vehicle and total time lower bounds of a formulated problem, pruning being
+    the knit_feasibility.Pruning of its time windows if any"""
+    fleet = getattr(data, 'fleet', None)
+    if total_time is None and fleet is not None:
+        total_time = fleet.total_times(data.demands, data.distances)[-1]
+    elif total_time is None:
+        total_time = total_time_matrix(data.demands, data.distances)
+    arcs = exclude = None
+    if pruning is not None:
+        arcs, exclude = pruning.arcs, pruning.unreachable
+    vehicles = fleet_lower_bound(data, total_time=total_time, exclude=exclude)
+    cost = cost_lower_bound(data, vehicles, total_time, arcs, exclude)
+    if fleet is not None:
+        # every vehicle used pays at least the cheapest fixed cost
+        cost += vehicles * fleet.min_fixed_cost
+    return Bounds(vehicles, cost)
+
+
+def gap(cost, bound):
+    """Gets how far above the lower bound a cost is, at least how far above the optimum it can be"""
+    return float(cost - bound) / bound if bound else 0.0
+
+
+def print_gap(bounds, cost, vehicles):
+    """Prints the lower bounds and the gap of a solution of the optimizer"""
+    print('lower bounds : {0} vehicles, total time {1}'.format(bounds.vehicles, bounds.cost))
+    print('solution : {0} vehicles, total time {1}, gap {2:.2%}\n'.format(
+        vehicles, cost, gap(cost, bounds.cost)))
@@ -0,0 +1,117 @@
+"""
+Knit Anemia Route Optimisation - Solution Cache
+Description :
+    keeps solved plans on disk keyed by a sha1 fingerprint of everything that decides the solution :
+    demands, travel time matrix, time slices, capacity or fleet, time windows, start / end locations
+    and search options
+    a hit gives back the stored dedicated routes and stops without formulating or solving,
+    a near miss (same matrix, capacity, windows and locations, other demands or options) gives the
+    routes of the most recent plan of the same family as warm start seed
+    the cache is bounded in bytes, the least recently used plans are evicted first
+    (the mtime of a plan file is its last use)
+Errors :
+    NONE
+"""
+from __future__ import print_function
+import glob
+import hashlib
+import io
+import json
+import os
+import numpy as np
+from knit_matrix import TIME_DTYPE, TriangularMatrix
+
+
+CACHE_DIR = '.knit_cache'
+MAX_BYTES = 64 << 20
+# search options changing the solution
+SEARCH_OPTIONS = ('portfolio', 'decompose', 'time_limit_ms', 'solution_limit', 'num_neighbours')
+
+
+def digest(*parts):
+    """Gets the sha1 of arrays (dtype, shape and bytes) and json values"""
+    sha1 = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            part = np.ascontiguousarray(part)
+            sha1.update('{0}{1}'.format(part.dtype.str, part.shape).encode('ascii'))
+            sha1.update(part.data)
+        else:
+            sha1.update(json.dumps(part, sort_keys=True).encode('utf-8'))
+    return sha1.hexdigest()
+
+
+def problem_keys(data, options):
+    """Gets the (key, family) fingerprints of an unformulated problem solved with the options"""
+    distances = data.distances
+    if isinstance(distances, TriangularMatrix):
+        distances = distances.values
+    windows = getattr(data, 'time_windows', None)
+    slices = getattr(data, 'time_slices', None)
+    fleet = getattr(data, 'fleet', None)
+    family = digest(np.asarray(distances, dtype=TIME_DTYPE), data.vehicle.capacity, data.depot,
+                    None if windows is None else np.asarray(windows, dtype=TIME_DTYPE),
+                    getattr(data, 'start_locations', None), getattr(data, 'end_locations', None),
+                    None if slices is None else digest(slices.starts, slices.travel),
+                    None if fleet is None else digest(
+                        fleet.vehicle_capacities, fleet.vehicle_fixed_costs,
+                        fleet.speed_levels[fleet.vehicle_speed_levels]))
+    key = digest(family, np.asarray(data.demands, dtype=TIME_DTYPE),
+                 [str(options.get(name)) for name in SEARCH_OPTIONS])
+    return key, family
+
+
+class SolutionCache(object):
+    """Stores one json file per plan, named after its family and key"""
+    def __init__(self, path=CACHE_DIR, max_bytes=MAX_BYTES):
+        """Initializes the cache, the directory is created on first store"""
+        self._path = path
+        self._max_bytes = max_bytes
+
+    def _file(self, key, family):
+        """Gets the file of a plan"""
+        return os.path.join(self._path, '{0}-{1}.json'.format(family, key))
+
+    def get(self, key, family):
+        """Gets the stored plan, None on a miss"""
+        path = self._file(key, family)
+        try:
+            with io.open(path) as f:
+                plan = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        os.utime(path, None)
+        return plan
+
+    def seed(self, family):
+        """Gets the routes of the most recently used plan of the family, None if there is none"""
+        paths = glob.glob(os.path.join(self._path, '{0}-*.json'.format(family)))
+        for path in sorted(paths, key=os.path.getmtime, reverse=True):
+            try:
+                with io.open(path) as f:
+                    return json.load(f)['routes']
+            except (IOError, OSError, ValueError, KeyError):
+                continue
+        return None
+
+    def put(self, key, family, plan):
+        """Stores a plan, then evicts the least recently used plans beyond the size bound"""
+        if not os.path.isdir(self._path):
+            os.makedirs(self._path)
+        path = self._file(key, family)
+        tmp_path = path + '.tmp'
+        with io.open(tmp_path, 'w') as f:
+            f.write(json.dumps(plan))
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used plans until the cache fits its size bound"""
+        plans = [(os.path.getmtime(path), os.path.getsize(path), path)
+                 for path in glob.glob(os.path.join(self._path, '*.json'))]
+        total = sum(size for _, size, _ in plans)
+        for _, size, path in sorted(plans):
+            if total <= self._max_bytes:
+                break
+            os.remove(path)
+            total -= size
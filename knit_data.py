@@ -0,0 +1,141 @@
+"""
+Knit Anemia Route Optimisation - Data Loader
+Description :
+    reads the demands, coordinates, time windows and travel time csv files straight into typed arrays
+    the travel time matrix is parsed in chunks of rows, checked to be square against its header,
+    and written to a .npy sidecar next to the csv keyed by the csv size and mtime (optionally its sha1)
+    later runs memory map the sidecar instead of parsing the csv again
+Errors :
+    ValueError when a csv is empty, ragged or not square
+"""
+from __future__ import print_function
+import csv
+import hashlib
+import io
+import json
+import os
+import numpy as np
+
+
+MATRIX_DTYPE = np.int32
+CHUNK_ROWS = 1024
+CACHE_SUFFIX = '.cache.npy'
+KEY_SUFFIX = '.cache.json'
+
+
+###########
+# Parsing #
+###########
+def load_demands(path, column=5, dtype=MATRIX_DTYPE):
+    """Reads one column of the demands csv, skipping the header"""
+    with io.open(path, 'r', newline='') as f:
+        reader = csv.reader(f)
+        if next(reader, None) is None:
+            raise ValueError('{0} is empty'.format(path))
+        return np.array([row[column] for row in reader if row]).astype(dtype)
+
+
+def load_coordinates(path, lat_column='lat', lon_column='lon'):
+    """Reads the (latitude, longitude) of each location from the named columns of a csv"""
+    with io.open(path, 'r', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            raise ValueError('{0} is empty'.format(path))
+        try:
+            columns = [header.index(lat_column), header.index(lon_column)]
+        except ValueError:
+            raise ValueError('{0} has no {1} and {2} columns'.format(path, lat_column, lon_column))
+        return np.array([[row[column] for column in columns] for row in reader if row],
+                        dtype=np.float64)
+
+
+def load_time_windows(path, open_column='open', close_column='close'):
+    """Reads the (open, close) time window of each location from the named columns of a csv"""
+    with io.open(path, 'r', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            raise ValueError('{0} is empty'.format(path))
+        try:
+            columns = [header.index(open_column), header.index(close_column)]
+        except ValueError:
+            raise ValueError('{0} has no {1} and {2} columns'.format(path, open_column, close_column))
+        return [tuple(int(row[column]) for column in columns) for row in reader if row]
+
+
+def read_matrix_csv(path, dtype=MATRIX_DTYPE, chunk_rows=CHUNK_ROWS):
+    """Parses a square matrix csv with a header row into a typed array, chunk_rows rows at a time"""
+    with io.open(path, 'r', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            raise ValueError('{0} is empty'.format(path))
+        size = len(header)
+        matrix = np.empty((size, size), dtype=dtype)
+        filled = 0
+        chunk = []
+        for row in reader:
+            if not row:
+                continue
+            if len(row) != size:
+                raise ValueError('{0}: row {1} has {2} columns, the header has {3}'.format(
+                    path, filled + len(chunk) + 1, len(row), size))
+            chunk.append(row)
+            if len(chunk) == chunk_rows:
+                filled = _store_chunk(path, matrix, filled, chunk)
+                chunk = []
+        filled = _store_chunk(path, matrix, filled, chunk)
+    if filled != size:
+        raise ValueError('{0}: {1} rows for {2} columns, the matrix is not square'.format(
+            path, filled, size))
+    return matrix
+
+
+def _store_chunk(path, matrix, filled, chunk):
+    """Converts a chunk of csv rows into the matrix, returns the number of rows filled"""
+    if not chunk:
+        return filled
+    if filled + len(chunk) > matrix.shape[0]:
+        raise ValueError('{0}: more rows than columns, the matrix is not square'.format(path))
+    matrix[filled:filled + len(chunk)] = np.array(chunk).astype(matrix.dtype)
+    return filled + len(chunk)
+
+
+#########
+# Cache #
+#########
+def file_key(path, use_hash=False):
+    """Gets the key identifying the current content of a file"""
+    stat = os.stat(path)
+    key = {'size': stat.st_size, 'mtime': stat.st_mtime}
+    if use_hash:
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        key['sha1'] = digest.hexdigest()
+    return key
+
+
+def load_matrix(path, dtype=MATRIX_DTYPE, cache=True, use_hash=False):
+    """Gets the matrix of a csv, memory mapped from its sidecar when the sidecar is up to date"""
+    if not cache:
+        return read_matrix_csv(path, dtype)
+    cache_path, key_path = path + CACHE_SUFFIX, path + KEY_SUFFIX
+    key = dict(file_key(path, use_hash), dtype=np.dtype(dtype).name)
+    try:
+        with open(key_path) as f:
+            if json.load(f) == key:
+                return np.load(cache_path, mmap_mode='r')
+    except (IOError, OSError, ValueError):
+        pass
+    matrix = read_matrix_csv(path, dtype)
+    # write the sidecar first, then the key, so a stale key never points at a new matrix
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, matrix)
+    os.replace(tmp_path, cache_path)
+    with open(key_path, 'w') as f:
+        json.dump(key, f)
+    return np.load(cache_path, mmap_mode='r')
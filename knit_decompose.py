@@ -0,0 +1,214 @@
+"""
+Knit Anemia Route Optimisation - Geographic Decomposition
+Description :
+    splits the villages into clusters around the depot (sweep angle or k-means), solves every cluster
+    as its own problem in a process pool, stitches the routes together and optionally lets the
+    solver improve the stitched routes across clusters on the full model
+    villages are placed on the plane from data.coordinates when available, otherwise from a
+    classical multidimensional scaling of the distance matrix
+Shorcomings :
+    every vehicle is assumed to start and end at the depot
+Errors :
+    NONE
+"""
+from __future__ import print_function
+import multiprocessing
+import numpy as np
+from knit_matrix import total_time_matrix
+from knit_solver import UNLIMITED_MS, extract_routes, routes_cost, solve_with_growing_fleet
+
+
+CLUSTER_SIZE = 100
+KMEANS_ITERATIONS = 20
+# improve time limit when the search parameters have none
+IMPROVE_TIME_LIMIT_MS = 30000
+# largest problem compared against a monolithic solve
+GAP_MAX_LOCATIONS = 300
+
+
+###############
+# Sub Problem #
+###############
+class SubProblem(object):
+    """Stores the data of the depot and one cluster of villages"""
+    def __init__(self, data, nodes):
+        """Initializes the sub problem, nodes are the villages of the cluster in data"""
+        self._vehicle = data.vehicle
+        self._nodes = np.concatenate(([data.depot], nodes)).astype(np.intp)
+        self._demands = np.asarray(data.demands)[self._nodes].tolist()
+        self._distances = np.asarray(data.distances)[np.ix_(self._nodes, self._nodes)]
+        self._time_windows = None
+        if getattr(data, 'time_windows', None) is not None:
+            self._time_windows = [data.time_windows[node] for node in self._nodes]
+
+    @property
+    def vehicle(self):
+        """Gets a vehicle"""
+        return self._vehicle
+
+    @property
+    def nodes(self):
+        """Gets the node of the full problem for each node of the sub problem"""
+        return self._nodes
+
+    @property
+    def demands(self):
+        """Gets demands at each location"""
+        return self._demands
+
+    @property
+    def num_locations(self):
+        """Gets number of locations"""
+        return len(self.demands)
+
+    @property
+    def num_vehicles(self):
+        """Gets number of vehicles"""
+        return len(self.demands)-1
+
+    @property
+    def req_vehicles(self):
+        """Gets number of vehicles dedicated before optimization"""
+        return 0
+
+    @property
+    def depot(self):
+        """Gets depot location index"""
+        return 0
+
+    @property
+    def distances(self):
+        """Gets distance between each pair of locations"""
+        return self._distances
+
+    @property
+    def time_windows(self):
+        """Gets the time window of each location, None without time windows"""
+        return self._time_windows
+
+
+##############
+# Clustering #
+##############
+def embed(distances):
+    """Places the locations on the plane by classical multidimensional scaling of the distances"""
+    distances = np.asarray(distances, dtype=np.float64)
+    squared = ((distances + distances.T) / 2.0) ** 2
+    # double centering
+    gram = -0.5 * (squared - squared.mean(axis=0) - squared.mean(axis=1)[:, np.newaxis] +
+                   squared.mean())
+    values, vectors = np.linalg.eigh(gram)
+    return vectors[:, -2:] * np.sqrt(np.maximum(values[-2:], 0))
+
+
+def positions(data):
+    """Gets a point on the plane for each location"""
+    coordinates = getattr(data, 'coordinates', None)
+    if coordinates is not None:
+        return np.asarray(coordinates, dtype=np.float64)
+    return embed(data.distances)
+
+
+def sweep_clusters(points, depot, num_clusters):
+    """Groups the villages in num_clusters slices of equal size by angle around the depot"""
+    villages = np.delete(np.arange(len(points)), depot)
+    offsets = points[villages] - points[depot]
+    order = villages[np.argsort(np.arctan2(offsets[:, 1], offsets[:, 0]), kind='stable')]
+    return [cluster for cluster in np.array_split(order, num_clusters) if cluster.size]
+
+
+def kmeans_clusters(points, depot, num_clusters, iterations=KMEANS_ITERATIONS):
+    """Groups the villages with k-means, starting from the sweep clusters"""
+    villages = np.delete(np.arange(len(points)), depot)
+    clusters = sweep_clusters(points, depot, num_clusters)
+    centers = np.array([points[cluster].mean(axis=0) for cluster in clusters])
+    labels = None
+    for _ in range(iterations):
+        gaps = ((points[villages][:, np.newaxis, :] - centers[np.newaxis, :, :]) ** 2).sum(axis=2)
+        new_labels = gaps.argmin(axis=1)
+        if labels is not None and (new_labels == labels).all():
+            break
+        labels = new_labels
+        for label in range(len(centers)):
+            members = villages[labels == label]
+            if members.size:
+                centers[label] = points[members].mean(axis=0)
+    return [villages[labels == label] for label in range(len(centers))
+            if (labels == label).any()]
+
+
+def clusters(data, cluster_size=CLUSTER_SIZE, method='sweep'):
+    """Gets the villages of each cluster"""
+    num_clusters = max(1, -(-(data.num_locations - 1) // cluster_size))
+    points = positions(data)
+    if method == 'kmeans':
+        return kmeans_clusters(points, data.depot, num_clusters)
+    if method == 'sweep':
+        return sweep_clusters(points, data.depot, num_clusters)
+    raise ValueError('unknown clustering method {0}'.format(method))
+
+
+#########
+# Solve #
+#########
+def solve_cluster(sub, model_builder, search_parameters):
+    """Solves one sub problem, returns its routes as nodes of the full problem"""
+    routing, assignment = solve_with_growing_fleet(sub, model_builder(sub), search_parameters)
+    if assignment is None:
+        raise ValueError('no solution for the cluster of villages {0}'.format(sub.nodes[1:].tolist()))
+    return [sub.nodes[route].tolist() for route in extract_routes(routing, assignment) if route]
+
+
+def solve_clusters(data, model_builder, search_parameters, cluster_size=CLUSTER_SIZE,
+                   method='sweep', processes=None):
+    """Solves every cluster in a process pool and stitches the routes"""
+    subs = [SubProblem(data, cluster) for cluster in clusters(data, cluster_size, method)]
+    pool = multiprocessing.Pool(processes or min(len(subs), multiprocessing.cpu_count()))
+    try:
+        results = [pool.apply_async(solve_cluster, (sub, model_builder, search_parameters))
+                   for sub in subs]
+        return [route for result in results for route in result.get()]
+    finally:
+        pool.terminate()
+
+
+def solve_decomposed(data, model_builder, search_parameters, cluster_size=CLUSTER_SIZE,
+                     method='sweep', improve=True, improve_time_limit_ms=None):
+    """Solves the problem cluster by cluster, returns the routing model and assignment of the full problem
+
+    improve runs the solver on the full model from the stitched routes so routes can cross clusters,
+    for improve_time_limit_ms, by default the time limit of the search parameters
+    """
+    routes = solve_clusters(data, model_builder, search_parameters, cluster_size, method)
+    routing = model_builder(data)(len(routes))
+    assignment = routing.ReadAssignmentFromRoutes(routes, True)
+    if improve and assignment is not None:
+        parameters = type(search_parameters)()
+        parameters.CopyFrom(search_parameters)
+        if improve_time_limit_ms is None:
+            time_limit_ms = int(getattr(search_parameters, 'time_limit_ms', 0) or 0)
+            improve_time_limit_ms = (
+                time_limit_ms if 0 < time_limit_ms < UNLIMITED_MS else IMPROVE_TIME_LIMIT_MS)
+        parameters.time_limit_ms = improve_time_limit_ms
+        improved = routing.SolveFromAssignmentWithParameters(assignment, parameters)
+        if improved is not None:
+            assignment = improved
+    return routing, assignment
+
+
+def decomposition_gap(data, model_builder, search_parameters, routing, assignment):
+    """Prints the cost of the decomposed solution against a monolithic solve and returns the gap,
+    None when either solve found no solution"""
+    if assignment is None:
+        return None
+    total_time = total_time_matrix(data.demands, data.distances)
+    decomposed = routes_cost(total_time, extract_routes(routing, assignment), data.depot)
+    routing, assignment = solve_with_growing_fleet(data, model_builder(data), search_parameters)
+    if assignment is None:
+        print('decomposed cost {0}, no monolithic solution to compare\n'.format(decomposed))
+        return None
+    monolithic = routes_cost(total_time, extract_routes(routing, assignment), data.depot)
+    gap = float(decomposed - monolithic) / monolithic if monolithic else 0.0
+    print('decomposed cost {0}, monolithic cost {1}, gap {2:.2%}\n'.format(
+        decomposed, monolithic, gap))
+    return gap
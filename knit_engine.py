@@ -0,0 +1,746 @@
+"""
+Knit Anemia Route Optimisation - Engine
+Description :
+    one engine for every variant of the scripts : the vehicle capacity always applies, explicit vehicle
+    start / end locations and village time windows are options of the same problem and combine freely
+    the data layer (demands, travel times, total time matrix) is built once and shared by every model
+    ortools, six and every module importing them are only imported once a model is built or solved,
+    so loading, validating and formulating a problem start instantly
+Usage :
+    python knit_engine.py validate --capacity=12000 [data options]
+    python knit_engine.py solve --capacity=12000 [data options] [solve options]
+    data options : --demands=test_demands1.csv --matrix=travel_times.csv --coordinates=FILE
+        --time-windows=FILE (open, close columns) --starts=2,0,0 --ends=0,0,0
+        --time-slices=0:travel_times.csv,720:market.csv (travel times from each start time on)
+        --fleet=FILE (name, count, capacity, fixed_cost, speed columns, replaces --capacity)
+    solve options : --callbacks --portfolio --decompose --warm --stream --time-limit=MS --solutions=N
+        --output=FILE --neighbours=K --report=FILE --profile=FILE --cache[=DIR] --fast
+Errors :
+    ValueError when the options do not fit the data
+"""
+from __future__ import print_function
+import functools
+import sys
+import numpy as np
+from knit_bounds import lower_bounds, print_gap
+from knit_cache import CACHE_DIR, SolutionCache, problem_keys
+from knit_data import load_coordinates, load_demands, load_matrix, load_time_windows
+from knit_feasibility import print_pruning, prune_time_windows
+from knit_fleet import load_fleet, scale_travel
+from knit_formulator import DEDICATED_ROUTE, formulate, reformulate, print_dedicated_routes
+from knit_matrix import TIME_DTYPE, TriangularMatrix, as_matrix, nearest_neighbours, patch_total_time
+from knit_matrix import read_only, total_time_matrix, travel_time_matrix
+from knit_profile import Profile, profiled
+from knit_slices import departure_range, load_time_slices, replay_stops
+
+
+DEMANDS_FILE = 'test_demands1.csv'
+MATRIX_FILE = 'travel_times.csv'
+# the dimension holding the total time of each route
+CAPACITY_DIMENSION = 'Capacity'
+
+
+###########################
+# Problem Data Definition #
+###########################
+class Vehicle(object):
+    """Stores the property of a vehicle"""
+    __slots__ = ('_capacity',)
+
+    def __init__(self, capacity):
+        """Initializes the vehicle properties"""
+        self._capacity = int(capacity)
+
+    @property
+    def capacity(self):
+        """Gets vehicle capacity"""
+        return self._capacity
+
+
+class DataProblem(object):
+    """Stores the data for the problem in contiguous int32 arrays, shared read-only by the evaluators
+
+    time_windows holds one (open, close) pair per location,
+    start_locations / end_locations one location per vehicle, missing vehicles use the depot,
+    time_slices (a knit_slices.TimeSlices) the travel times of each part of the day,
+    distances then being the longest of the day,
+    fleet (a knit_fleet.Fleet) the vehicles, the formulator dedicating the largest ones
+    and leaving the others to the optimizer
+    only the formulator writes to the demands
+    """
+    __slots__ = ('_vehicle', '_depot', '_req_vehicles', '_dedicated_routes', '_demands',
+                 '_distances', '_coordinates', '_time_windows', '_start_locations', '_end_locations',
+                 '_time_slices', '_loaded_fleet', '_fleet')
+
+    def __init__(self, demands, distances, capacity, time_windows=None, start_locations=None,
+                 end_locations=None, coordinates=None, depot=0, time_slices=None, fleet=None):
+        """Initializes the data for the problem"""
+        self._loaded_fleet = self._fleet = fleet
+        self._vehicle = Vehicle(capacity if fleet is None else fleet.max_capacity)
+        self._depot = depot
+        self._req_vehicles = 0
+        self._dedicated_routes = None
+        self._demands = np.array(demands, dtype=TIME_DTYPE)
+        # a triangular matrix is already compact, anything else is viewed as an int32 array
+        if not isinstance(distances, TriangularMatrix):
+            distances = read_only(as_matrix(distances))
+        self._distances = distances
+        self._coordinates = coordinates
+        self._time_windows = None
+        if time_windows is not None:
+            self._time_windows = read_only(
+                np.array(time_windows, dtype=TIME_DTYPE).reshape(-1, 2))
+        self._start_locations = self._end_locations = None
+        if start_locations is not None or end_locations is not None:
+            self._start_locations = self._fleet_locations(start_locations)
+            self._end_locations = self._fleet_locations(end_locations)
+        self._time_slices = time_slices
+        self.validate()
+
+    def _fleet_locations(self, locations):
+        """Gets one location per vehicle, the depot for the vehicles not listed"""
+        locations = [int(location) for location in locations or []]
+        return locations + [self._depot] * (self.num_vehicles - len(locations))
+
+    def validate(self):
+        """Checks that every option fits the number of locations"""
+        size = self.num_locations
+        if tuple(np.shape(self._distances))[:2] != (size, size):
+            raise ValueError('{0} demands for a {1} distance matrix'.format(
+                size, np.shape(self._distances)))
+        if self._time_slices is not None and tuple(self._time_slices.shape) != (size, size):
+            raise ValueError('{0} demands for {1} time slice matrices'.format(
+                size, self._time_slices.shape))
+        if self._time_windows is not None:
+            if len(self._time_windows) != size:
+                raise ValueError('{0} time windows for {1} locations'.format(
+                    len(self._time_windows), size))
+            late = np.flatnonzero(self._time_windows[:, 0] > self._time_windows[:, 1])
+            if late.size:
+                raise ValueError('time windows of locations {0} close before they open'.format(
+                    late.tolist()))
+        for name, locations in (('start', self._start_locations), ('end', self._end_locations)):
+            if locations is None:
+                continue
+            if len(locations) > self.num_vehicles:
+                raise ValueError('{0} {1} locations for {2} vehicles'.format(
+                    len(locations), name, self.num_vehicles))
+            outside = [location for location in locations if not 0 <= location < size]
+            if outside:
+                raise ValueError('{0} locations {1} are not locations'.format(name, outside))
+
+    @property
+    def vehicle(self):
+        """Gets a vehicle"""
+        return self._vehicle
+
+    @property
+    def demands(self):
+        """Gets demands at each location"""
+        return self._demands
+
+    @property
+    def num_locations(self):
+        """Gets number of locations"""
+        return len(self.demands)
+
+    @property
+    def num_vehicles(self):
+        """Gets number of vehicles"""
+        if self._fleet is not None:
+            return self._fleet.num_vehicles
+        return len(self.demands)-1
+
+    @property
+    def req_vehicles(self):
+        """Gets number of vehicles dedicated by the formulator"""
+        return self._req_vehicles
+
+    @property
+    def depot(self):
+        """Gets depot location index"""
+        return self._depot
+
+    @property
+    def distances(self):
+        """Gets distance between each pair of locations"""
+        return self._distances
+
+    @property
+    def coordinates(self):
+        """Gets the (latitude, longitude) of each location, None if unknown"""
+        return self._coordinates
+
+    @property
+    def time_windows(self):
+        """Gets the (open, close) time window of each location, None without time windows"""
+        return self._time_windows
+
+    @property
+    def window_opens(self):
+        """Gets the time each location opens"""
+        return self._time_windows[:, 0]
+
+    @property
+    def window_closes(self):
+        """Gets the time each location closes"""
+        return self._time_windows[:, 1]
+
+    @property
+    def start_locations(self):
+        """Gets the start location of each vehicle, None when they all start at the depot"""
+        return self._start_locations
+
+    @property
+    def end_locations(self):
+        """Gets the end location of each vehicle, None when they all end at the depot"""
+        return self._end_locations
+
+    @property
+    def time_slices(self):
+        """Gets the travel times of each part of the day, None when they never change"""
+        return self._time_slices
+
+    @property
+    def fleet(self):
+        """Gets the vehicle classes left to the optimizer, None when every vehicle is alike"""
+        return self._fleet
+
+    @property
+    def dedicated_routes(self):
+        """Gets the routes of the vehicles dedicated by the formulator"""
+        return self._dedicated_routes
+
+    def print_demands(self):
+        """Prints the demand of every location"""
+        for demand in self._demands.tolist():
+            print('{0} , '.format(demand))
+
+    def formulator(self):
+        """Dedicates full vehicles to the oversized villages and keeps their residual demand"""
+        print('formulator\n')
+        formulation = formulate(self._demands, self._distances, self._vehicle.capacity,
+                                self._depot, self._req_vehicles + 1)
+        self._dedicate(self._req_vehicles + len(formulation.routes))
+        self._demands[:] = formulation.demands.tolist()
+        self._dedicated_routes = formulation.routes
+        return formulation.routes
+
+    def update_demands(self, demands):
+        """Sets new demands for a few villages and formulates only those villages"""
+        self._dedicated_routes = reformulate(self._demands, self._dedicated_routes, demands,
+                                             self._distances, self._vehicle.capacity, self._depot)
+        self._dedicate(len(self._dedicated_routes))
+
+    def _dedicate(self, req_vehicles):
+        """Counts the dedicated vehicles, taken from the largest vehicles of the fleet if any"""
+        if self._loaded_fleet is not None:
+            self._fleet = self._loaded_fleet.dedicate(req_vehicles)
+        self._req_vehicles = req_vehicles
+
+
+def load_problem(capacity, demands_file=DEMANDS_FILE, matrix_file=MATRIX_FILE,
+                 coordinates_file=None, time_windows_file=None, start_locations=None,
+                 end_locations=None, time_slices=None, fleet_file=None):
+    """Loads a problem from csv files, travel times are computed from the coordinates when given
+
+    time_slices, (start, matrix csv) pairs, replace the matrix by travel times changing over the day,
+    the vehicle classes of fleet_file replace the capacity
+    """
+    coordinates = load_coordinates(coordinates_file) if coordinates_file else None
+    fleet = load_fleet(fleet_file) if fleet_file else None
+    if fleet is not None:
+        capacity = fleet.max_capacity
+    if time_slices:
+        time_slices = load_time_slices(time_slices, capacity)
+        distances = time_slices.slowest()
+    elif coordinates is None:
+        # memory mapped from the .npy sidecar when the matrix csv has not changed
+        distances = load_matrix(matrix_file)
+    else:
+        distances = travel_time_matrix(coordinates)
+    time_windows = load_time_windows(time_windows_file) if time_windows_file else None
+    return DataProblem(load_demands(demands_file), distances, capacity, time_windows,
+                       start_locations, end_locations, coordinates, time_slices=time_slices or None,
+                       fleet=fleet)
+
+
+#######################
+# Problem Constraints #
+#######################
+class CreateTimeEvaluator(object):
+    """Creates callback to get total times between locations."""
+    def __init__(self, data):
+        """Initializes the total time matrix."""
+        self._distances = data.distances
+        self._time_slices = getattr(data, 'time_slices', None)
+        self._fleet = getattr(data, 'fleet', None)
+        self._pruning = None
+        travel = data.distances if self._time_slices is None else self._longest(data)
+        # precompute total time to have time callback in O(1)
+        if self._fleet is None:
+            self._total_time = total_time_matrix(data.demands, travel)
+        else:
+            # one matrix and one evaluator per speed of the fleet, the fastest bounds every vehicle
+            self._speed_times = self._fleet.total_times(data.demands, travel)
+            self._speed_evaluators = [functools.partial(matrix_evaluator, total_time)
+                                      for total_time in self._speed_times]
+            self._total_time = self._speed_times[-1]
+
+    def _longest(self, data, villages=None):
+        """Gets the longest travel time from each location over the slices it can be left in"""
+        earliest, latest = departure_range(data.demands, data.vehicle.capacity,
+                                           getattr(data, 'time_windows', None))
+        if villages is not None:
+            earliest, latest = earliest[villages], latest[villages]
+        return self._time_slices.longest(earliest, latest, villages)
+
+    @property
+    def total_time(self):
+        """Gets the total time matrix"""
+        return self._total_time
+
+    def pruning(self, data):
+        """Gets the arcs and villages the time windows rule out (see knit_feasibility) for the current
+        total times, None without time windows"""
+        if getattr(data, 'time_windows', None) is None:
+            return None
+        if self._pruning is None:
+            self._pruning = prune_time_windows(data, self._total_time)
+        return self._pruning
+
+    def update_demands(self, data, villages):
+        """Recomputes the total times leaving from villages whose demand changed"""
+        # another service time rules out other arcs
+        self._pruning = None
+        distances = data.distances
+        if self._time_slices is not None:
+            # a longer service moves the departures, and maybe their slices
+            villages = [int(village) for village in villages]
+            distances = dict(zip(villages, self._longest(data, villages)))
+        if self._fleet is None:
+            patch_total_time(self._total_time, data.demands, distances, villages)
+            return
+        for speed, total_time in zip(self._fleet.speed_levels.tolist(), self._speed_times):
+            rows = {int(village): scale_travel(distances[village], speed) for village in villages}
+            patch_total_time(total_time, data.demands, rows, villages)
+
+    def travel_time(self, from_node, to_node, departure=0):
+        """Returns the travel time between the two nodes leaving at departure"""
+        if self._time_slices is None:
+            return int(self._distances[from_node][to_node])
+        return self._time_slices.travel_time(from_node, to_node, departure)
+
+    def time_evaluator(self, from_node, to_node):
+        """Returns the total time between the two nodes"""
+        return int(self._total_time[from_node, to_node])
+
+    def vehicle_evaluators(self, fleet, num_vehicles):
+        """Gets the total time evaluator of each of the first num_vehicles vehicles of a fleet of the
+        same speeds, the vehicles of one speed sharing one evaluator"""
+        return [self._speed_evaluators[level]
+                for level in fleet.vehicle_speed_levels[:num_vehicles].tolist()]
+
+
+def matrix_evaluator(matrix, from_node, to_node):
+    """Returns the value of the matrix between the two nodes"""
+    return int(matrix[from_node, to_node])
+
+
+def add_capacity_constraints(routing, data, time_evaluator, use_callbacks=False):
+    """Adds capacity constraint, with waiting allowed when the villages have time windows"""
+    from knit_solver import add_matrix_dimension
+    slack_max = 0 if getattr(data, 'time_windows', None) is None else data.vehicle.capacity
+    add_matrix_dimension(
+        routing,
+        time_evaluator.total_time,
+        time_evaluator.time_evaluator,
+        slack_max,
+        data.vehicle.capacity, # vehicle maximum capacity
+        CAPACITY_DIMENSION,
+        use_callbacks)
+
+
+def add_fleet_constraints(routing, data, time_evaluator):
+    """Costs the arcs of each vehicle and bounds its Capacity dimension by its class : the total time
+    of its speed, its capacity and its fixed cost"""
+    from knit_solver import add_vehicle_dimension, set_vehicle_costs
+    num_vehicles = routing.vehicles()
+    evaluators = time_evaluator.vehicle_evaluators(data.fleet, num_vehicles)
+    callbacks = set_vehicle_costs(routing, evaluators,
+                                  data.fleet.vehicle_fixed_costs[:num_vehicles].tolist())
+    slack_max = 0 if getattr(data, 'time_windows', None) is None else data.vehicle.capacity
+    add_vehicle_dimension(routing, callbacks, slack_max,
+                          data.fleet.vehicle_capacities[:num_vehicles].tolist(), CAPACITY_DIMENSION)
+
+
+def add_time_window_constraints(routing, data):
+    """Keeps the time at which each location is reached within its time window"""
+    time_dimension = routing.GetDimensionOrDie(CAPACITY_DIMENSION)
+    for node, (open_time, close_time) in enumerate(data.time_windows):
+        index = routing.NodeToIndex(node)
+        if index >= 0:
+            time_dimension.CumulVar(index).SetRange(int(open_time), int(close_time))
+    # vehicle starts and ends have no index of their own
+    for vehicle_id in range(routing.vehicles()):
+        for index in (routing.Start(vehicle_id), routing.End(vehicle_id)):
+            open_time, close_time = data.time_windows[routing.IndexToNode(index)]
+            time_dimension.CumulVar(index).SetRange(int(open_time), int(close_time))
+
+
+def build_model(data, time_evaluator, num_vehicles, use_callbacks=False, neighbours=None,
+                prune=False):
+    """Creates the routing model for a fleet of num_vehicles, only with the neighbour arcs if given
+
+    prune removes the arcs and villages the time windows rule out for the current demands
+    """
+    from knit_solver import create_routing_model, exclude_nodes, remove_arcs, restrict_arcs
+    from knit_solver import set_arc_costs
+    routing = create_routing_model(data, num_vehicles, use_callbacks)
+    if getattr(data, 'fleet', None) is not None:
+        add_fleet_constraints(routing, data, time_evaluator)
+    else:
+        # Define weight of each edge
+        set_arc_costs(routing, time_evaluator.time_evaluator)
+        # Add Capacity constraint
+        add_capacity_constraints(routing, data, time_evaluator, use_callbacks)
+    if getattr(data, 'time_windows', None) is not None:
+        add_time_window_constraints(routing, data)
+    if neighbours is not None:
+        restrict_arcs(routing, neighbours)
+    pruning = time_evaluator.pruning(data) if prune else None
+    if pruning is not None:
+        remove_arcs(routing, pruning.arcs)
+        exclude_nodes(routing, pruning.unreachable)
+    return routing
+
+
+def model_builder(data, use_callbacks=False, num_neighbours=None, time_evaluator=None):
+    """Gets the function building the routing model of the data for a given fleet size
+
+    num_neighbours restricts the arcs to the num_neighbours closest villages of each village,
+    time_evaluator is shared with the caller when given, e.g. to patch it after demand changes,
+    the arcs and villages the time windows rule out are pruned from the evaluator's total times
+    """
+    if time_evaluator is None:
+        time_evaluator = CreateTimeEvaluator(data)
+    neighbours = None
+    if num_neighbours:
+        neighbours = nearest_neighbours(data.distances, int(num_neighbours))
+    return functools.partial(build_model, data, time_evaluator, use_callbacks=use_callbacks,
+                             neighbours=neighbours,
+                             prune=getattr(data, 'time_windows', None) is not None)
+
+
+def search_parameters(time_limit_ms=None, solution_limit=None):
+    """Gets the search parameters, first solution by path cheapest arc"""
+    from ortools.constraint_solver import pywrapcp
+    from ortools.constraint_solver import routing_enums_pb2
+    from knit_solver import limit_search
+    parameters = pywrapcp.RoutingModel.DefaultSearchParameters()
+    parameters.first_solution_strategy = (
+        routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC)
+    return limit_search(parameters, time_limit_ms, solution_limit)
+
+
+###########
+# Printer #
+###########
+class ConsolePrinter(object):
+    """Print solution to console"""
+    def __init__(self, data, routing, assignment):
+        """Initializes the printer"""
+        self._data = data
+        self._routing = routing
+        self._assignment = assignment
+        self._stops = None
+
+    @property
+    def data(self):
+        """Gets problem data"""
+        return self._data
+
+    @property
+    def routing(self):
+        """Gets routing model"""
+        return self._routing
+
+    @property
+    def assignment(self):
+        """Gets routing model"""
+        return self._assignment
+
+    def stops(self):
+        """Gets every stop of the used vehicles, extracted once"""
+        from knit_output import extract_stops
+        if self._stops is None:
+            self._stops = real_times(
+                self.data, extract_stops(self.routing, self.assignment, CAPACITY_DIMENSION))
+        return self._stops
+
+    def print(self):
+        """Prints assignment on console"""
+        print_stops(self.stops(), self.data.req_vehicles)
+
+
+def real_times(data, stops):
+    """Gets the stops with the times the roads really give when travel times change over the day,
+    the model having planned with the longest ones"""
+    if getattr(data, 'time_slices', None) is None:
+        return stops
+    opens = None if data.time_windows is None else data.window_opens
+    return replay_stops(stops, data.time_slices, data.demands, opens)
+
+
+def print_stops(stops, req_vehicles):
+    """Prints the routes of the optimizer after the req_vehicles dedicated ones"""
+    from knit_output import write_console
+    print('after optimization\n')
+    req_vehicles = write_console(stops, req_vehicles)
+    print('No Of Required Vehicles are {0}'.format(req_vehicles))
+
+
+def print_cached(data, plan, output=None):
+    """Prints a plan of the solution cache as a solve would have, writes its routes to output"""
+    from knit_output import ROUTE_STOP, write_routes
+    print_dedicated_routes(np.array([tuple(route) for route in plan['dedicated']],
+                                    dtype=DEDICATED_ROUTE), data.depot, data.vehicle.capacity)
+    stops = np.array([tuple(stop) for stop in plan['stops']], dtype=ROUTE_STOP)
+    print_stops(stops, plan['req_vehicles'])
+    if output:
+        write_routes(output, stops)
+
+
+#########
+# Solve #
+#########
+def solve(data, use_callbacks=False, portfolio=False, decompose=False, warm=False,
+          time_limit_ms=None, solution_limit=None, stream=False, sink=None, output=None,
+          num_neighbours=None, report=None, profile=None, show_demands=False, cache=None, fast=False):
+    """Formulates and solves a loaded problem, prints the routes
+
+    use_callbacks falls back to per arc python callbacks,
+    portfolio solves with several strategies on all cores and keeps the best,
+    decompose solves clusters of villages around the depot separately,
+    warm starts from the routes saved by the previous warm run of the same problem family
+    and saves the new ones (see knit_warmstart),
+    time_limit_ms and solution_limit bound the search,
+    stream prints and sink receives every improving solution,
+    output also writes the routes to a .jsonl, .csv or .npz file,
+    num_neighbours only lets each village be followed by its closest villages,
+    report writes the stage times, evaluator calls, search statistics and gap to a json file,
+    cache (a knit_cache.SolutionCache) answers a problem solved before without solving it
+    and seeds the search with the routes of a similar one,
+    fast estimates the routes with the numpy heuristic of knit_heuristic instead of ortools
+    returns the routing model and the assignment, both None when the plan came from the cache
+    or from the fast heuristic
+    """
+    if (decompose or fast) and data.start_locations is not None:
+        raise ValueError('{0} needs every vehicle to start and end at the depot'.format(
+            'the fast heuristic' if fast else 'decomposition'))
+    if fast and data.time_windows is not None:
+        raise ValueError('the fast heuristic does not check time windows')
+    if (decompose or fast) and data.fleet is not None:
+        raise ValueError('{0} needs every vehicle to be alike'.format(
+            'the fast heuristic' if fast else 'decomposition'))
+    profile = profile or Profile()
+    if warm or cache is not None:
+        # the family also names the warm start routes, taken before the formulator dedicates vehicles
+        key, family = problem_keys(data, {
+            'portfolio': portfolio, 'decompose': decompose, 'time_limit_ms': time_limit_ms,
+            'solution_limit': solution_limit, 'num_neighbours': num_neighbours})
+    if cache is not None:
+        plan = cache.get(key, family)
+        if plan is not None:
+            print('cached plan {0}\n'.format(key))
+            print_cached(data, plan, output)
+            return None, None
+    with profile.stage('formulator'):
+        data.formulator()
+    print_dedicated_routes(data.dedicated_routes, data.depot, data.vehicle.capacity)
+    if data.fleet is not None:
+        data.fleet.print_fleet()
+    if show_demands:
+        print('\n')
+        data.print_demands()
+    if fast:
+        solve_fast_routes(data, output, profile)
+        if report:
+            profile.write(report)
+        return None, None
+    with profile.stage('solver import'):
+        from knit_decompose import GAP_MAX_LOCATIONS, decomposition_gap, solve_decomposed
+        from knit_output import write_routes
+        from knit_portfolio import solve_portfolio
+        from knit_solver import check_speed_classes, extract_routes, print_solution
+        from knit_solver import solve_with_growing_fleet
+        from knit_warmstart import load_routes, routes_file, save_routes, solve_warm
+    if data.fleet is not None:
+        check_speed_classes(data.fleet.speed_levels.size)
+    if stream and sink is None:
+        sink = print_solution
+    with profile.stage('evaluator precompute'):
+        time_evaluator = CreateTimeEvaluator(data)
+    pruning = None
+    if data.time_windows is not None:
+        with profile.stage('feasibility pruning'):
+            pruning = time_evaluator.pruning(data)
+        print_pruning(pruning)
+    with profile.stage('model setup'):
+        build = model_builder(data, use_callbacks, num_neighbours, time_evaluator)
+    if report:
+        profile.count_calls(time_evaluator, 'time_evaluator')
+        sink = profile.sink(sink)
+    build = profile.timed('model build', build)
+    parameters = search_parameters(time_limit_ms, solution_limit)
+    # Solve the problem, starting from the smallest fleet able to serve the demands
+    # or from yesterday's routes
+    routes = load_routes(routes_file(family)) if warm else None
+    if routes is None and cache is not None:
+        routes = cache.seed(family)
+    with profile.stage('solve'):
+        if portfolio:
+            routing, assignment = solve_portfolio(data, build, time_limit_ms=time_limit_ms,
+                                                  solution_limit=solution_limit)
+        elif decompose:
+            builder = functools.partial(model_builder, use_callbacks=use_callbacks,
+                                        num_neighbours=num_neighbours)
+            routing, assignment = solve_decomposed(data, builder, parameters)
+            if data.num_locations <= GAP_MAX_LOCATIONS:
+                decomposition_gap(data, builder, parameters, routing, assignment)
+        elif routes:
+            routing, assignment = solve_warm(data, build, parameters, routes, sink,
+                                             time_evaluator.total_time, pruning)
+        else:
+            routing, assignment = solve_with_growing_fleet(data, build, parameters, sink=sink,
+                                                           total_time=time_evaluator.total_time)
+    profile.record_search(routing, assignment)
+    if assignment is not None:
+        saved = [route for route in extract_routes(routing, assignment) if route]
+    with profile.stage('printing'):
+        if assignment is None:
+            # a time or solution limit can stop the search before any solution
+            print('no solution found\n')
+        else:
+            printer = ConsolePrinter(data, routing, assignment)
+            printer.print()
+            if output:
+                write_routes(output, printer.stops())
+    if warm and assignment is not None:
+        try:
+            save_routes(routes_file(family), saved)
+        except (IOError, OSError) as error:
+            # the routes are printed already, only the next warm start loses them
+            print('routes not saved for the next warm start : {0}\n'.format(error))
+    if assignment is not None:
+        with profile.stage('bounds'):
+            bounds = lower_bounds(data, time_evaluator.total_time, pruning)
+        print_gap(bounds, assignment.ObjectiveValue(), len(saved))
+        profile.record_gap(bounds, assignment.ObjectiveValue())
+    if cache is not None and assignment is not None:
+        cache.put(key, family, {'routes': saved, 'cost': assignment.ObjectiveValue(),
+                                'req_vehicles': data.req_vehicles,
+                                'dedicated': data.dedicated_routes.tolist(),
+                                'stops': printer.stops().tolist()})
+    if report:
+        profile.write(report)
+    return routing, assignment
+
+
+def solve_fast_routes(data, output=None, profile=None):
+    """Estimates the routes of a formulated problem with the numpy heuristic, prints them"""
+    from knit_heuristic import solve_fast
+    from knit_output import write_routes
+    profile = profile or Profile()
+    with profile.stage('fast solve'):
+        solution = solve_fast(data)
+    with profile.stage('printing'):
+        stops = real_times(data, solution.stops)
+        print_stops(stops, data.req_vehicles)
+        if output:
+            write_routes(output, stops)
+    with profile.stage('bounds'):
+        bounds = lower_bounds(data)
+    print_gap(bounds, solution.cost, len(solution.routes))
+    profile.record_gap(bounds, solution.cost)
+    return solution
+
+
+################
+# Command Line #
+################
+def command_line_value(name, default=None, argv=None):
+    """Gets the value of a --name=value command line argument"""
+    prefix = '--{0}='.format(name)
+    for argument in sys.argv[1:] if argv is None else argv:
+        if argument.startswith(prefix):
+            return argument[len(prefix):]
+    return default
+
+
+def command_line_locations(name, argv=None):
+    """Gets the locations of a --name=2,0,0 command line argument, None without it"""
+    value = command_line_value(name, None, argv)
+    if value is None:
+        return None
+    return [int(location) for location in value.split(',') if location]
+
+
+def command_line_slices(argv=None):
+    """Gets the (start, matrix csv) pairs of a --time-slices=0:a.csv,720:b.csv argument, None if none"""
+    value = command_line_value('time-slices', None, argv)
+    if value is None:
+        return None
+    return [(int(start), path) for start, path in
+            (pair.split(':', 1) for pair in value.split(',') if pair)]
+
+
+def solve_options(argv=None):
+    """Gets the solve options of the command line"""
+    argv = sys.argv[1:] if argv is None else argv
+    return {'use_callbacks': '--callbacks' in argv, 'portfolio': '--portfolio' in argv,
+            'decompose': '--decompose' in argv, 'warm': '--warm' in argv,
+            'time_limit_ms': command_line_value('time-limit', None, argv),
+            'solution_limit': command_line_value('solutions', None, argv),
+            'stream': '--stream' in argv, 'output': command_line_value('output', None, argv),
+            'num_neighbours': command_line_value('neighbours', None, argv),
+            'report': command_line_value('report', None, argv),
+            'cache': solution_cache(argv), 'fast': '--fast' in argv}
+
+
+def solution_cache(argv=None):
+    """Gets the solution cache of a --cache or --cache=DIR command line argument, None without it"""
+    argv = sys.argv[1:] if argv is None else argv
+    path = command_line_value('cache', CACHE_DIR if '--cache' in argv else None, argv)
+    return SolutionCache(path) if path else None
+
+
+def main(argv):
+    """Validates or solves the problem described by the command line"""
+    mode = argv[0] if argv and not argv[0].startswith('--') else 'solve'
+    if mode not in ('validate', 'solve'):
+        raise ValueError('unknown mode {0}'.format(mode))
+    capacity = command_line_value('capacity', None, argv)
+    fleet_file = command_line_value('fleet', None, argv)
+    if capacity is None and fleet_file is None:
+        raise ValueError('--capacity or --fleet is required')
+    profile = Profile()
+    with profile.stage('data load'):
+        data = load_problem(capacity and int(capacity), command_line_value('demands', DEMANDS_FILE, argv),
+                            command_line_value('matrix', MATRIX_FILE, argv),
+                            command_line_value('coordinates', None, argv),
+                            command_line_value('time-windows', None, argv),
+                            command_line_locations('starts', argv),
+                            command_line_locations('ends', argv),
+                            command_line_slices(argv), fleet_file)
+    if mode == 'validate':
+        data.formulator()
+        print('{0} locations, {1} dedicated vehicles, {2} residual demand'.format(
+            data.num_locations, data.req_vehicles, int(np.sum(data.demands))))
+        return
+    with profiled(command_line_value('profile', None, argv)):
+        solve(data, profile=profile, **solve_options(argv))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
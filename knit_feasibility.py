@@ -0,0 +1,68 @@
+"""
+Knit Anemia Route Optimisation - Time Window Feasibility
+Description :
+    finds before the model is built which arcs no route can ever use and which villages no route can
+    ever serve, so the solver spends no search on them
+    the Capacity dimension holds the time a location is reached, an arc i -> j adds the service time of i
+    plus the travel time to j, so i -> j is infeasible when leaving i as early as it opens still reaches
+    j after it closes (or after the vehicle capacity)
+    a village is unreachable when no chain of feasible arcs leads to it from a vehicle start,
+    or from it to a vehicle end
+Errors :
+    NONE
+"""
+from __future__ import print_function
+from collections import namedtuple
+import numpy as np
+
+
+Pruning = namedtuple('Pruning', ['arcs', 'unreachable'])
+
+
+def feasible_arcs(total_time, opens, closes, capacity):
+    """Gets True for every arc that can be used within the time windows, in one vectorized pass"""
+    closes = np.minimum(np.asarray(closes, dtype=np.int64), capacity)
+    arrivals = np.asarray(total_time, dtype=np.int64) + np.asarray(opens, dtype=np.int64)[:, np.newaxis]
+    arcs = arrivals <= closes[np.newaxis, :]
+    np.fill_diagonal(arcs, False)
+    return arcs
+
+
+def reachable(arcs, sources, passable, reverse=False):
+    """Gets the locations reached from the sources through the passable locations
+
+    reverse follows the arcs backwards, i.e. gets the locations the sources can be reached from
+    """
+    seen = np.zeros(arcs.shape[0], dtype=bool)
+    seen[list(sources)] = True
+    frontier = seen.copy()
+    while frontier.any():
+        if reverse:
+            frontier = arcs[:, frontier].any(axis=1)
+        else:
+            frontier = arcs[frontier].any(axis=0)
+        frontier &= passable & ~seen
+        seen |= frontier
+    return seen
+
+
+def prune_time_windows(data, total_time):
+    """Gets the feasible arcs and the villages that can never be served within their time windows"""
+    windows = np.asarray(data.time_windows, dtype=np.int64).reshape(-1, 2)
+    arcs = feasible_arcs(total_time, windows[:, 0], windows[:, 1], data.vehicle.capacity)
+    starts = set(getattr(data, 'start_locations', None) or [data.depot])
+    ends = set(getattr(data, 'end_locations', None) or [data.depot])
+    villages = np.ones(arcs.shape[0], dtype=bool)
+    villages[list(starts | ends)] = False
+    served = (reachable(arcs, starts, villages) &
+              reachable(arcs, ends, villages, reverse=True) & villages)
+    return Pruning(arcs, np.flatnonzero(villages & ~served))
+
+
+def print_pruning(pruning):
+    """Prints how many arcs were removed and the villages that can never be served"""
+    print('time windows rule out {0} arcs'.format(
+        int(pruning.arcs.size - pruning.arcs.shape[0] - np.count_nonzero(pruning.arcs))))
+    if pruning.unreachable.size:
+        print('villages {0} can never be served within their time windows\n'.format(
+            pruning.unreachable.tolist()))
@@ -0,0 +1,155 @@
+"""
+Knit Anemia Route Optimisation - Heterogeneous Fleet
+Description :
+    mixed vans and motorbikes : every vehicle class has a number of vehicles, a capacity (of the
+    Capacity dimension, i.e. total time), a fixed cost paid once a vehicle of the class is used
+    and a speed factor dividing its travel times (2 travels twice as fast)
+    the total time matrix is precomputed once per speed of the fleet, not per vehicle, and the vehicles
+    of one speed share one evaluator, registered once with the solver so they share one cost class
+    the fleet is ordered from the largest capacity down, so a fleet of k vehicles is the k largest,
+    the trips of the formulator take the largest vehicles and the optimizer gets the others
+    the growing fleet search offers every vehicle at once, the fixed costs and speeds choosing
+    which ones are used
+Shorcomings :
+    ortools versions without RegisterTransitCallback wrap every evaluator passed once per vehicle,
+    a fleet of several speeds is refused there, a single speed shares one callback
+Fleet file :
+    name,count,capacity,fixed_cost,speed
+    van,4,12000,500,1
+    motorbike,10,3000,50,1.5
+Errors :
+    ValueError when the fleet file misses a column, the fleet has no vehicle or fewer vehicles of
+    the largest capacity than the formulator dedicates, or has several speeds on an older ortools
+"""
+from __future__ import print_function
+import csv
+import io
+import numpy as np
+from knit_matrix import TIME_DTYPE, as_matrix, read_only, total_time_matrix
+
+
+FLEET_COLUMNS = ('name', 'count', 'capacity', 'fixed_cost', 'speed')
+
+
+def scale_travel(travel, speed):
+    """Gets the travel times of a vehicle class, rounded to whole time units"""
+    if speed == 1:
+        return travel
+    return np.rint(np.asarray(travel, dtype=np.float64) / speed).astype(TIME_DTYPE)
+
+
+class Fleet(object):
+    """Stores the vehicle classes of a fleet and the class of every vehicle"""
+    __slots__ = ('_names', '_counts', '_capacities', '_fixed_costs', '_speeds', '_vehicle_classes',
+                 '_speed_levels', '_class_speed_levels')
+
+    def __init__(self, names, counts, capacities, fixed_costs, speeds):
+        """Initializes the fleet from one value per class"""
+        counts = np.asarray(counts, dtype=np.int64)
+        speeds = np.asarray(speeds, dtype=np.float64)
+        if counts.sum() <= 0:
+            raise ValueError('the fleet has no vehicle')
+        if (speeds <= 0).any():
+            raise ValueError('speed factors must be positive, got {0}'.format(speeds.tolist()))
+        capacities = np.asarray(capacities, dtype=np.int64)
+        order = np.argsort(-capacities, kind='stable')
+        self._names = [names[position] for position in order.tolist()]
+        self._counts = read_only(counts[order])
+        self._capacities = read_only(capacities[order])
+        self._fixed_costs = read_only(np.asarray(fixed_costs, dtype=np.int64)[order])
+        self._speeds = read_only(speeds[order])
+        self._vehicle_classes = read_only(np.repeat(np.arange(len(order)), self._counts))
+        # classes of the same speed share their total time matrix, slowest first
+        speed_levels, class_speed_levels = np.unique(self._speeds, return_inverse=True)
+        self._speed_levels = read_only(speed_levels)
+        self._class_speed_levels = read_only(class_speed_levels.ravel())
+
+    @property
+    def names(self):
+        """Gets the name of each class"""
+        return self._names
+
+    @property
+    def num_vehicles(self):
+        """Gets the number of vehicles of the fleet"""
+        return self._vehicle_classes.size
+
+    @property
+    def max_capacity(self):
+        """Gets the capacity of the largest vehicle"""
+        return int(self._capacities[0])
+
+    @property
+    def speed_levels(self):
+        """Gets the distinct speed factors of the fleet, slowest first"""
+        return self._speed_levels
+
+    @property
+    def vehicle_classes(self):
+        """Gets the class of every vehicle"""
+        return self._vehicle_classes
+
+    @property
+    def vehicle_capacities(self):
+        """Gets the capacity of every vehicle"""
+        return self._capacities[self._vehicle_classes]
+
+    @property
+    def vehicle_fixed_costs(self):
+        """Gets the fixed cost of every vehicle"""
+        return self._fixed_costs[self._vehicle_classes]
+
+    @property
+    def vehicle_speed_levels(self):
+        """Gets the position in speed_levels of the speed of every vehicle"""
+        return self._class_speed_levels[self._vehicle_classes]
+
+    @property
+    def min_fixed_cost(self):
+        """Gets the fixed cost of the cheapest vehicle"""
+        return int(self._fixed_costs.min())
+
+    def dedicate(self, trips):
+        """Gets the fleet left to the optimizer once trips vehicles of the largest capacity are
+        dedicated by the formulator, the classes keeping their speeds even without vehicles left"""
+        largest = np.flatnonzero(self._capacities == self._capacities[0])
+        available = int(self._counts[largest].sum())
+        if trips > available:
+            raise ValueError('the formulator dedicates {0} vehicles of capacity {1}, '
+                             'the fleet has {2}'.format(trips, self.max_capacity, available))
+        counts = self._counts.copy()
+        for position in largest.tolist():
+            taken = min(trips, int(counts[position]))
+            counts[position] -= taken
+            trips -= taken
+        return Fleet(self._names, counts, self._capacities, self._fixed_costs, self._speeds)
+
+    def total_times(self, demands, distances):
+        """Gets the total time matrix of every speed of the fleet as one contiguous array"""
+        travel = as_matrix(distances)
+        total_times = np.empty((self._speed_levels.size,) + travel.shape, dtype=TIME_DTYPE)
+        for level, speed in enumerate(self._speed_levels.tolist()):
+            total_times[level] = total_time_matrix(demands, scale_travel(travel, speed))
+        return total_times
+
+    def print_fleet(self):
+        """Prints the vehicle classes"""
+        for name, count, capacity, fixed_cost, speed in zip(
+                self._names, self._counts.tolist(), self._capacities.tolist(),
+                self._fixed_costs.tolist(), self._speeds.tolist()):
+            print('{0} x {1} : capacity {2}, fixed cost {3}, speed x{4}'.format(
+                count, name, capacity, fixed_cost, speed))
+
+
+def load_fleet(path):
+    """Reads the vehicle classes of a fleet csv"""
+    with io.open(path, 'r', newline='') as f:
+        rows = list(csv.DictReader(f))
+    if not rows:
+        raise ValueError('{0} has no vehicle class'.format(path))
+    missing = [column for column in FLEET_COLUMNS if column not in rows[0]]
+    if missing:
+        raise ValueError('{0} has no {1} column'.format(path, ', '.join(missing)))
+    return Fleet([row['name'] for row in rows], [int(row['count']) for row in rows],
+                 [int(row['capacity']) for row in rows], [int(row['fixed_cost']) for row in rows],
+                 [float(row['speed']) for row in rows])
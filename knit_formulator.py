@@ -0,0 +1,76 @@
+"""
+Knit Anemia Route Optimisation - Formulator
+Description :
+    dedicates full vehicles to villages whose demand plus the round trip from the depot does not fit one vehicle
+    and reduces their demand to what is left for the optimizer
+    the number of dedicated trips of every village is computed at once by closed form division
+Errors :
+    ValueError when a village is too far from the depot for a vehicle to deliver anything
+"""
+from __future__ import print_function
+from collections import namedtuple
+import numpy as np
+
+
+DEDICATED_ROUTE = np.dtype([('vehicle', np.int32), ('village', np.int32), ('load', np.int64)])
+
+Formulation = namedtuple('Formulation', ['trips', 'demands', 'routes'])
+
+
+def formulate(demands, distances, capacity, depot=0, first_vehicle=1, villages=None):
+    """Gets the dedicated trips per village, the residual demands and one dedicated route per trip
+
+    villages limits the formulation to those villages, demands then holds one demand per village
+    """
+    demand = np.asarray(demands, dtype=np.int64)
+    round_trip = 2 * np.asarray(distances[depot], dtype=np.int64)
+    if villages is None:
+        villages = np.arange(demand.size, dtype=np.int32)
+    else:
+        villages = np.asarray(villages, dtype=np.int32)
+        round_trip = round_trip[villages]
+    # what a vehicle dedicated to the village can deliver
+    load = capacity - round_trip
+    oversized = demand + round_trip > capacity
+    unreachable = np.flatnonzero(oversized & (load <= 0))
+    if unreachable.size:
+        raise ValueError('villages {0} are too far from the depot for a vehicle of capacity {1}'.format(
+            villages[unreachable].tolist(), capacity))
+    # smallest number of trips leaving at most one load, i.e. ceil(demand / load) - 1
+    trips = np.zeros_like(demand)
+    trips[oversized] = -((load[oversized] - demand[oversized]) // load[oversized])
+    residual = demand - trips * load
+    positions = np.repeat(np.arange(demand.size), trips)
+    routes = np.empty(positions.size, dtype=DEDICATED_ROUTE)
+    routes['vehicle'] = np.arange(first_vehicle, first_vehicle + positions.size)
+    routes['village'] = villages[positions]
+    routes['load'] = load[positions]
+    return Formulation(trips, residual, routes)
+
+
+def reformulate(demands, dedicated_routes, changes, distances, capacity, depot=0):
+    """Formulates only the villages whose demand changed, as the full formulator would have
+
+    demands are updated in place with the residual demand of the changed villages
+    changes maps a village to its new demand, returns all the dedicated routes renumbered
+    """
+    villages = np.array(sorted(changes), dtype=np.int32)
+    formulation = formulate([changes[village] for village in villages.tolist()], distances,
+                            capacity, depot, villages=villages)
+    for village, residual in zip(villages.tolist(), formulation.demands.tolist()):
+        demands[village] = residual
+    if dedicated_routes is None:
+        dedicated_routes = np.empty(0, dtype=DEDICATED_ROUTE)
+    kept = dedicated_routes[~np.isin(dedicated_routes['village'], villages)]
+    routes = np.concatenate([kept, formulation.routes])
+    routes = routes[np.argsort(routes['village'], kind='stable')]
+    routes['vehicle'] = np.arange(1, routes.size + 1)
+    return routes
+
+
+def print_dedicated_routes(routes, depot, capacity):
+    """Prints the dedicated routes on console"""
+    print(''.join(
+        'Route of Vehilce {0}\n\n{1} Load({2}) -> {3} Load({4}) -> {1} Load({5})\n\n'.format(
+            route['vehicle'], depot, 0, route['village'], route['load'], capacity)
+        for route in routes), end='')
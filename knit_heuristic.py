@@ -0,0 +1,262 @@
+"""
+Knit Anemia Route Optimisation - Fast Heuristic Solver
+Description :
+    quick estimates without ortools, on the same DataProblem and the same total time matrix as the model
+    construction : Clarke-Wright savings over the nearest neighbour pairs, merged in decreasing savings
+    order while the merged route stays within the vehicle capacity
+    improvement : relocate / Or-opt (segments of 1 to 3 villages moved next to one of their neighbours,
+    within a route or to another route with room for them) and 2-opt inside each route, every candidate
+    move of a segment or a route being priced at once with numpy, until no move improves
+    don't look bits : after the first pass only the villages next to which a move changed the routes are
+    tried again, and only the routes a move changed are 2-opted again
+    a route costs, and loads, the sum of the total times of its arcs, as in the Capacity dimension
+Shorcomings :
+    every vehicle starts and ends at the depot, time windows are not checked
+Errors :
+    NONE
+"""
+from __future__ import print_function
+from collections import deque, namedtuple
+import numpy as np
+from knit_matrix import nearest_neighbours, total_time_matrix
+
+
+NEIGHBOURS = 20
+MAX_PASSES = 20
+MAX_SEGMENT = 3
+
+Solution = namedtuple('Solution', ['routes', 'cost', 'stops'])
+
+
+class Routes(object):
+    """Stores routes as linked lists : successor, predecessor, route and load of every village
+
+    the depot marks the end of a route in succ and its start in pred, first holds the first village of
+    every route, the depot once the route is empty
+    """
+    def __init__(self, total_time, depot, num_locations):
+        """Initializes one route per village"""
+        self.total_time = total_time
+        self.depot = depot
+        self.succ = np.full(num_locations, depot, dtype=np.intp)
+        self.pred = np.full(num_locations, depot, dtype=np.intp)
+        self.route = np.arange(num_locations)
+        self.first = np.arange(num_locations)
+        self.first[depot] = depot
+        self.load = total_time[depot] + total_time[:, depot]
+        self.load[depot] = 0
+        # villages of the segment being moved, reset after every move
+        self.moving = np.zeros(num_locations, dtype=bool)
+
+    def nodes(self, route_id):
+        """Gets the villages of a route in order"""
+        nodes = []
+        node = self.first[route_id]
+        while node != self.depot:
+            nodes.append(int(node))
+            node = self.succ[node]
+        return nodes
+
+    def routes(self):
+        """Gets the villages of every non empty route"""
+        return [self.nodes(route_id) for route_id in np.flatnonzero(self.first != self.depot)]
+
+    def segment(self, node, length):
+        """Gets the length villages of a route starting at node, None if the route ends before"""
+        segment = [node]
+        while len(segment) < length:
+            node = int(self.succ[node])
+            if node == self.depot:
+                return None
+            segment.append(node)
+        return segment
+
+    def unlink(self, start, end):
+        """Takes the villages start to end out of their route"""
+        before, after = self.pred[start], self.succ[end]
+        if before == self.depot:
+            self.first[self.route[start]] = after
+        else:
+            self.succ[before] = after
+        if after != self.depot:
+            self.pred[after] = before
+
+    def link(self, start, end, before, after, route_id):
+        """Puts the villages start to end between before and after in a route"""
+        if before == self.depot:
+            self.first[route_id] = start
+        else:
+            self.succ[before] = start
+        if after != self.depot:
+            self.pred[after] = end
+        self.pred[start] = before
+        self.succ[end] = after
+
+
+def savings(data, total_time, neighbours, capacity):
+    """Builds the routes by Clarke-Wright savings over the neighbour pairs"""
+    depot = data.depot
+    routes = Routes(total_time, depot, total_time.shape[0])
+    froms = np.repeat(np.arange(neighbours.shape[0]), neighbours.shape[1])
+    tos = neighbours.ravel()
+    keep = (froms != depot) & (tos != depot) & (froms != tos)
+    froms, tos = froms[keep], tos[keep]
+    # time saved by going from the end of one route straight to the start of another
+    saved = total_time[froms, depot] + total_time[depot, tos] - total_time[froms, tos]
+    order = np.argsort(-saved, kind='stable')
+    order = order[saved[order] > 0]
+    members = {node: [node] for node in range(total_time.shape[0]) if node != depot}
+    last = np.arange(total_time.shape[0])
+    route, load, first = routes.route, routes.load, routes.first
+    for tail, head, gain in zip(froms[order].tolist(), tos[order].tolist(), saved[order].tolist()):
+        tail_route, head_route = route[tail], route[head]
+        if tail_route == head_route or last[tail_route] != tail or first[head_route] != head:
+            continue
+        merged_load = load[tail_route] + load[head_route] - gain
+        if merged_load > capacity:
+            continue
+        routes.succ[tail], routes.pred[head] = head, tail
+        # the longer route keeps its id
+        if len(members[tail_route]) >= len(members[head_route]):
+            kept, merged = tail_route, head_route
+            last[kept] = last[head_route]
+        else:
+            kept, merged = head_route, tail_route
+            first[kept] = first[tail_route]
+        route[members[merged]] = kept
+        members[kept].extend(members.pop(merged))
+        load[kept], load[merged] = merged_load, 0
+        first[merged] = depot
+    return routes
+
+
+def relocate(routes, node, length, neighbours, capacity):
+    """Moves the segment of length villages starting at node next to the neighbour where it saves most
+
+    returns the villages next to which the routes changed, None when the segment did not move
+    """
+    segment = routes.segment(node, length)
+    if segment is None:
+        return None
+    total_time, depot, moving = routes.total_time, routes.depot, routes.moving
+    end = segment[-1]
+    before, after = routes.pred[node], routes.succ[end]
+    inside = total_time[segment[:-1], segment[1:]].sum()
+    removal = total_time[before, node] + total_time[end, after] - total_time[before, after]
+    moving[segment] = True
+    try:
+        candidates = neighbours[node]
+        candidates = candidates[(candidates != depot) & ~moving[candidates]]
+        # after a candidate, or before it
+        lefts = np.concatenate((candidates, routes.pred[candidates]))
+        rights = np.concatenate((routes.succ[candidates], candidates))
+        # spots touching the segment are where it already is
+        valid = ~moving[lefts] & ~moving[rights]
+    finally:
+        moving[segment] = False
+    insertion = total_time[lefts, node] + total_time[end, rights] - total_time[lefts, rights]
+    targets = routes.route[np.concatenate((candidates, candidates))]
+    own = targets == routes.route[node]
+    valid &= own | (routes.load[targets] + inside + insertion <= capacity)
+    delta = np.where(valid, insertion - removal, 0)
+    if not delta.size:
+        return None
+    best = int(delta.argmin())
+    if delta[best] >= 0:
+        return None
+    source, target = routes.route[node], targets[best]
+    left, right = lefts[best], rights[best]
+    routes.unlink(node, end)
+    routes.link(node, end, left, right, target)
+    routes.route[segment] = target
+    if own[best]:
+        routes.load[source] += delta[best]
+    else:
+        routes.load[source] -= inside + removal
+        routes.load[target] += inside + insertion[best]
+    return [int(village) for village in (before, after, left, right) if village != depot] + segment
+
+
+def two_opt(routes, route_id):
+    """Reverses the part of a route saving most, until no reversal saves, returns True if any did"""
+    total_time, depot = routes.total_time, routes.depot
+    improved = False
+    while True:
+        path = np.array([depot] + routes.nodes(route_id) + [depot], dtype=np.intp)
+        size = path.size - 2
+        if size < 2:
+            return improved
+        forward = np.concatenate(([0], np.cumsum(total_time[path[:-1], path[1:]])))
+        backward = np.concatenate(([0], np.cumsum(total_time[path[1:], path[:-1]])))
+        # reverse path[start:stop + 1]
+        start, stop = np.triu_indices(size, 1)
+        start, stop = start + 1, stop + 1
+        old = forward[stop + 1] - forward[start - 1]
+        new = (total_time[path[start - 1], path[stop]] + total_time[path[start], path[stop + 1]] +
+               backward[stop] - backward[start])
+        delta = new - old
+        best = int(delta.argmin())
+        if delta[best] >= 0:
+            return improved
+        path[start[best]:stop[best] + 1] = path[start[best]:stop[best] + 1][::-1].copy()
+        nodes = path[1:-1]
+        routes.first[route_id] = nodes[0]
+        routes.succ[nodes] = np.append(nodes[1:], depot)
+        routes.pred[nodes] = np.insert(nodes[:-1], 0, depot)
+        routes.load[route_id] += delta[best]
+        improved = True
+
+
+def route_stops(routes, total_time, depot):
+    """Gets the routes as the structured stops the console printer prints, see knit_output"""
+    from knit_output import ROUTE_STOP
+    paths = [[depot] + route + [depot] for route in routes]
+    stops = np.zeros(sum(len(path) for path in paths), dtype=ROUTE_STOP)
+    position = 0
+    for vehicle_id, path in enumerate(paths):
+        path = np.array(path, dtype=np.intp)
+        cumul = np.concatenate(([0], np.cumsum(total_time[path[:-1], path[1:]])))
+        stops[position:position + path.size] = list(zip(
+            [vehicle_id] * path.size, path.tolist(), cumul.tolist()))
+        position += path.size
+    return stops
+
+
+def solve_fast(data, num_neighbours=NEIGHBOURS, max_passes=MAX_PASSES, total_time=None):
+    """Solves a formulated problem with savings and local search, returns (routes, cost, stops)"""
+    if total_time is None:
+        total_time = total_time_matrix(data.demands, data.distances)
+    total_time = np.asarray(total_time, dtype=np.int64)
+    capacity = data.vehicle.capacity
+    neighbours = nearest_neighbours(total_time, num_neighbours)
+    routes = savings(data, total_time, neighbours, capacity)
+    # don't look bits : only villages next to which the routes changed are tried again
+    queue = deque(node for node in range(total_time.shape[0]) if node != data.depot)
+    queued = np.zeros(total_time.shape[0], dtype=bool)
+    queued[list(queue)] = True
+    changed = set(np.flatnonzero(routes.first != data.depot).tolist())
+    for _ in range(max_passes):
+        while queue:
+            node = queue.popleft()
+            queued[node] = False
+            for length in range(1, MAX_SEGMENT + 1):
+                touched = relocate(routes, node, length, neighbours, capacity)
+                if touched is not None:
+                    changed.update(routes.route[touched].tolist())
+                    for village in touched:
+                        if not queued[village]:
+                            queued[village] = True
+                            queue.append(village)
+                    break
+        for route_id in changed:
+            if routes.first[route_id] != data.depot and two_opt(routes, route_id):
+                for village in routes.nodes(route_id):
+                    if not queued[village]:
+                        queued[village] = True
+                        queue.append(village)
+        changed = set()
+        if not queue:
+            break
+    found = routes.routes()
+    return Solution(found, int(routes.load[routes.first != data.depot].sum()),
+                    route_stops(found, total_time, data.depot))
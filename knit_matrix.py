@@ -0,0 +1,196 @@
+"""
+Knit Anemia Route Optimisation - Matrix Engine
+Description :
+    builds the dense matrices shared by the evaluators with numpy instead of python loops
+    total time = service time of the origin village + travel time to the destination, zero on the diagonal
+    travel times can be computed from village coordinates (haversine distance times a road factor)
+Shorcomings :
+    the whole n x n matrix is kept in memory (int32, 4 bytes per cell), only travel times can be
+    stored as a triangle
+Errors :
+    NONE
+"""
+from __future__ import print_function
+import multiprocessing
+import numpy as np
+
+
+TIME_DTYPE = np.int32
+
+
+def as_matrix(distances, dtype=TIME_DTYPE):
+    """Gets the distances as a square typed array, without copying if it already is one"""
+    matrix = np.asarray(distances, dtype=dtype)
+    if matrix.ndim != 2 or matrix.shape[0] != matrix.shape[1]:
+        raise ValueError('distance matrix must be square, got shape {0}'.format(matrix.shape))
+    return matrix
+
+
+def read_only(array):
+    """Gets a view of the array that cannot be written to, the array itself stays writable"""
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+def total_time_matrix(demands, distances, dtype=TIME_DTYPE):
+    """Builds the total time matrix in one vectorized pass"""
+    service = np.asarray(demands, dtype=np.int64)
+    travel = as_matrix(distances)
+    if service.shape != (travel.shape[0],):
+        raise ValueError('{0} demands for a {1} x {1} distance matrix'.format(
+            service.shape[0], travel.shape[0]))
+    if travel.size and int(service.max()) + int(travel.max()) > np.iinfo(dtype).max:
+        raise OverflowError('total time does not fit in {0}'.format(np.dtype(dtype).name))
+    # service row broadcast over the travel matrix, written straight into the int32 store
+    total_time = np.empty(travel.shape, dtype=dtype)
+    np.add(travel, service[:, np.newaxis].astype(dtype), out=total_time)
+    np.fill_diagonal(total_time, 0)
+    return total_time
+
+
+def patch_total_time(total_time, demands, distances, villages):
+    """Recomputes in place the rows of the total time matrix leaving from the given villages"""
+    villages = np.asarray(villages, dtype=np.intp)
+    service = np.asarray([demands[village] for village in villages.tolist()], dtype=np.int64)
+    travel = np.array([distances[village] for village in villages.tolist()], dtype=np.int64)
+    rows = travel + service[:, np.newaxis]
+    if rows.size and rows.max() > np.iinfo(total_time.dtype).max:
+        raise OverflowError('total time does not fit in {0}'.format(total_time.dtype.name))
+    rows[np.arange(villages.size), villages] = 0
+    total_time[villages] = rows
+    return total_time
+
+
+###################
+# Travel Matrices #
+###################
+EARTH_RADIUS_KM = 6371.0088
+# road distance over great circle distance
+ROAD_FACTOR = 1.3
+SPEED_KMH = 30.0
+BLOCK_ROWS = 512
+# below this many locations the blocks are computed in this process
+PARALLEL_MIN_LOCATIONS = 2000
+
+
+class TriangularMatrix(object):
+    """Stores a symmetric matrix with a zero diagonal as its upper triangle, in half the memory"""
+    def __init__(self, size, values):
+        """Initializes the matrix from the upper triangle values, row after row"""
+        if len(values) != size * (size - 1) // 2:
+            raise ValueError('{0} values for the upper triangle of a {1} x {1} matrix'.format(
+                len(values), size))
+        self._size = size
+        self._values = values
+
+    @property
+    def shape(self):
+        """Gets the shape of the full matrix"""
+        return (self._size, self._size)
+
+    @property
+    def values(self):
+        """Gets the upper triangle values, row after row"""
+        return self._values
+
+    @property
+    def nbytes(self):
+        """Gets the memory used by the values"""
+        return self._values.nbytes
+
+    def __len__(self):
+        """Gets the number of rows"""
+        return self._size
+
+    def _offset(self, row):
+        """Gets the position of the first value right of the diagonal in a row"""
+        return row * self._size - row * (row + 1) // 2
+
+    def row(self, row):
+        """Gets one full row"""
+        values = np.zeros(self._size, dtype=self._values.dtype)
+        before = np.arange(row)
+        values[:row] = self._values[self._offset(before) + row - before - 1]
+        start = self._offset(row)
+        values[row + 1:] = self._values[start:start + self._size - row - 1]
+        return values
+
+    def __getitem__(self, key):
+        """Gets a row, or the value(s) at (from, to)"""
+        if not isinstance(key, tuple):
+            return self.row(key)
+        low, high = np.minimum(*key), np.maximum(*key)
+        values = self._values[np.where(low == high, 0, self._offset(low) + high - low - 1)]
+        return np.where(low == high, 0, values)
+
+    def __array__(self, dtype=None, copy=None):
+        """Gets the full matrix"""
+        dense = np.zeros(self.shape, dtype=dtype or self._values.dtype)
+        rows, columns = np.triu_indices(self._size, 1)
+        dense[rows, columns] = self._values
+        dense[columns, rows] = self._values
+        return dense
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Gets the great circle distance between points given in radians"""
+    half_chord = (np.sin((lat2 - lat1) / 2) ** 2 +
+                  np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(half_chord, 1.0)))
+
+
+def _travel_time_block(task):
+    """Gets the travel times from the rows start:stop to every location, or to the later ones"""
+    radians, start, stop, minutes_per_km, upper, dtype = task
+    first_column = start if upper else 0
+    minutes = haversine_km(radians[start:stop, 0, np.newaxis], radians[start:stop, 1, np.newaxis],
+                           radians[np.newaxis, first_column:, 0],
+                           radians[np.newaxis, first_column:, 1]) * minutes_per_km
+    block = np.rint(minutes).astype(dtype)
+    if upper:
+        return block[np.triu_indices(stop - start, 1, block.shape[1])]
+    return block
+
+
+def travel_time_matrix(coordinates, speed_kmh=SPEED_KMH, road_factor=ROAD_FACTOR,
+                       symmetric=False, block_rows=BLOCK_ROWS, processes=None, dtype=TIME_DTYPE):
+    """Builds the travel time matrix in minutes from (latitude, longitude) pairs in degrees
+
+    rows are computed block_rows at a time, in a process pool for large matrices
+    symmetric returns a TriangularMatrix instead of the full array
+    """
+    radians = np.radians(np.asarray(coordinates, dtype=np.float64))
+    if radians.ndim != 2 or radians.shape[1] != 2:
+        raise ValueError('coordinates must be (latitude, longitude) pairs')
+    size = radians.shape[0]
+    minutes_per_km = 60.0 * road_factor / speed_kmh
+    tasks = [(radians, start, min(start + block_rows, size), minutes_per_km, symmetric, dtype)
+             for start in range(0, size, block_rows)]
+    if size >= PARALLEL_MIN_LOCATIONS and (processes or multiprocessing.cpu_count()) > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            blocks = pool.map(_travel_time_block, tasks)
+        finally:
+            pool.terminate()
+    else:
+        blocks = [_travel_time_block(task) for task in tasks]
+    if symmetric:
+        return TriangularMatrix(size, np.concatenate(blocks) if blocks else np.zeros(0, dtype))
+    return np.concatenate(blocks) if blocks else np.zeros((0, 0), dtype)
+
+
+##############
+# Neighbours #
+##############
+def nearest_neighbours(distances, k):
+    """Gets the k closest other locations of every location, one row per location, closest first"""
+    matrix = np.array(distances, dtype=np.int64)
+    size = matrix.shape[0]
+    k = min(k, size - 1)
+    if k <= 0:
+        return np.zeros((size, 0), dtype=np.intp)
+    np.fill_diagonal(matrix, np.iinfo(np.int64).max)
+    candidates = np.argpartition(matrix, k - 1, axis=1)[:, :k]
+    order = np.argsort(np.take_along_axis(matrix, candidates, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
@@ -0,0 +1,108 @@
+"""
+Knit Anemia Route Optimisation - Route Output
+Description :
+    pulls every route of an assignment into one structured array in a single pass, one record per stop,
+    skipping unused vehicles as soon as their start leads straight to their end
+    writers : console, json lines (one route per line), csv (one stop per row) and columnar .npz
+    (one array per field), all through buffered files
+Errors :
+    ValueError for an output file with an unknown extension
+"""
+from __future__ import print_function
+from six.moves import xrange
+import csv
+import io
+import json
+import os
+import numpy as np
+
+
+ROUTE_STOP = np.dtype([('vehicle', np.int32), ('node', np.int32), ('cumul', np.int64)])
+BUFFER_SIZE = 1 << 16
+
+
+##############
+# Extraction #
+##############
+def extract_stops(routing, assignment, dimension='Capacity'):
+    """Gets one record per stop of every used vehicle, in route order"""
+    cumul_dimension = routing.GetDimensionOrDie(dimension)
+    vehicles, nodes, cumuls = [], [], []
+    for vehicle_id in xrange(routing.vehicles()):
+        index = routing.Start(vehicle_id)
+        next_index = assignment.Value(routing.NextVar(index))
+        if routing.IsEnd(next_index) and routing.IndexToNode(index) == routing.IndexToNode(next_index):
+            continue
+        while True:
+            vehicles.append(vehicle_id)
+            nodes.append(routing.IndexToNode(index))
+            cumuls.append(assignment.Value(cumul_dimension.CumulVar(index)))
+            if routing.IsEnd(index):
+                break
+            index = assignment.Value(routing.NextVar(index))
+    stops = np.empty(len(nodes), dtype=ROUTE_STOP)
+    stops['vehicle'] = vehicles
+    stops['node'] = nodes
+    stops['cumul'] = cumuls
+    return stops
+
+
+def split_routes(stops):
+    """Splits the stops into one array per vehicle"""
+    if not stops.size:
+        return []
+    return np.split(stops, np.flatnonzero(np.diff(stops['vehicle'])) + 1)
+
+
+###########
+# Writers #
+###########
+def write_console(stops, req_vehicles=0):
+    """Prints every route ending with a positive load, returns the number of vehicles then required"""
+    lines = []
+    for route in split_routes(stops):
+        if route['cumul'][-1] > 0:
+            req_vehicles += 1
+            lines.append('Route for vehicle {0}:\n{1}\n\n'.format(req_vehicles, ' ->'.join(
+                ' {0} Load({1})'.format(node, cumul)
+                for node, cumul in zip(route['node'].tolist(), route['cumul'].tolist()))))
+    print(''.join(lines), end='')
+    return req_vehicles
+
+
+def write_json_lines(path, stops):
+    """Writes one json object per route"""
+    with io.open(path, 'w', buffering=BUFFER_SIZE) as f:
+        for route in split_routes(stops):
+            f.write(json.dumps({'vehicle': int(route['vehicle'][0]),
+                                'nodes': route['node'].tolist(),
+                                'cumuls': route['cumul'].tolist()}) + '\n')
+
+
+def write_csv(path, stops):
+    """Writes one row per stop"""
+    with io.open(path, 'w', newline='', buffering=BUFFER_SIZE) as f:
+        writer = csv.writer(f)
+        writer.writerow(ROUTE_STOP.names)
+        writer.writerows(stops.tolist())
+
+
+def write_columnar(path, stops):
+    """Writes one array per field"""
+    np.savez(path, **dict((name, stops[name]) for name in ROUTE_STOP.names))
+
+
+WRITERS = {
+    '.jsonl': write_json_lines,
+    '.csv': write_csv,
+    '.npz': write_columnar,
+}
+
+
+def write_routes(path, stops):
+    """Writes the stops with the writer matching the file extension"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in WRITERS:
+        raise ValueError('no route writer for {0} files, use one of {1}'.format(
+            extension, ', '.join(sorted(WRITERS))))
+    WRITERS[extension](path, stops)
@@ -0,0 +1,94 @@
+"""
+Knit Anemia Route Optimisation - Portfolio Solve
+Description :
+    solves the same problem with several first solution strategies and local search metaheuristics
+    at once, one process per strategy, each with the same overall deadline for all its fleet sizes
+    the best routes found when the deadline hits are read back into a routing model in this process,
+    a strategy that fails is reported and left out
+Shorcomings :
+    every worker builds its own routing model, build_model and data must be picklable
+Errors :
+    NONE
+"""
+from __future__ import print_function
+import multiprocessing
+import time
+from ortools.constraint_solver import pywrapcp
+from ortools.constraint_solver import routing_enums_pb2
+from knit_solver import extract_routes, limit_search, solve_with_growing_fleet
+
+
+# (first solution strategy, local search metaheuristic)
+STRATEGIES = [
+    ('PATH_CHEAPEST_ARC', 'GUIDED_LOCAL_SEARCH'),
+    ('SAVINGS', 'GUIDED_LOCAL_SEARCH'),
+    ('PATH_CHEAPEST_ARC', 'SIMULATED_ANNEALING'),
+    ('PARALLEL_CHEAPEST_INSERTION', 'TABU_SEARCH'),
+    ('CHRISTOFIDES', 'GREEDY_DESCENT'),
+    ('GLOBAL_CHEAPEST_ARC', 'GUIDED_LOCAL_SEARCH'),
+]
+TIME_LIMIT_MS = 30000
+# time given to the workers on top of their time limit to build the model and report
+GRACE_MS = 5000
+
+
+def search_parameters(first_solution, metaheuristic, time_limit_ms, solution_limit=None):
+    """Gets search parameters for one strategy of the portfolio"""
+    parameters = pywrapcp.RoutingModel.DefaultSearchParameters()
+    parameters.first_solution_strategy = getattr(
+        routing_enums_pb2.FirstSolutionStrategy, first_solution)
+    parameters.local_search_metaheuristic = getattr(
+        routing_enums_pb2.LocalSearchMetaheuristic, metaheuristic)
+    return limit_search(parameters, time_limit_ms, solution_limit)
+
+
+def solve_strategy(data, build_model, first_solution, metaheuristic, time_limit_ms,
+                   solution_limit=None):
+    """Solves with one strategy, returns (cost, routes) or None when no solution is found
+
+    time_limit_ms bounds every fleet size tried together, see knit_solver.solve_with_growing_fleet
+    """
+    routing, assignment = solve_with_growing_fleet(data, build_model, search_parameters(
+        first_solution, metaheuristic, time_limit_ms, solution_limit))
+    if assignment is None:
+        return None
+    return assignment.ObjectiveValue(), extract_routes(routing, assignment)
+
+
+def solve_portfolio(data, build_model, strategies=None, time_limit_ms=None, solution_limit=None,
+                    processes=None):
+    """Solves with every strategy in parallel and returns the routing model and assignment of the best
+
+    both are None when no strategy finds a solution before the deadline
+    """
+    strategies = strategies or STRATEGIES
+    time_limit_ms = int(time_limit_ms or TIME_LIMIT_MS)
+    deadline = time.time() + (time_limit_ms + GRACE_MS) / 1000.0
+    pool = multiprocessing.Pool(processes or min(len(strategies), multiprocessing.cpu_count()))
+    try:
+        pending = [(strategy, pool.apply_async(
+            solve_strategy, (data, build_model) + tuple(strategy) + (time_limit_ms, solution_limit)))
+                   for strategy in strategies]
+        best = None
+        for strategy, result in pending:
+            try:
+                solution = result.get(max(0.0, deadline - time.time()))
+            except multiprocessing.TimeoutError:
+                continue
+            except Exception as error:  # pylint: disable=broad-except
+                # one failing strategy leaves the others their solutions
+                print('portfolio : {0} + {1} failed, {2}: {3}'.format(
+                    strategy[0], strategy[1], type(error).__name__, error))
+                continue
+            if solution is not None and (best is None or solution[0] < best[1][0]):
+                best = (strategy, solution)
+    finally:
+        # workers still running past the deadline are dropped
+        pool.terminate()
+    if best is None:
+        print('portfolio : no strategy found a solution\n')
+        return None, None
+    (first_solution, metaheuristic), (cost, routes) = best
+    print('portfolio : {0} + {1} with cost {2}\n'.format(first_solution, metaheuristic, cost))
+    routing = build_model(len(routes))
+    return routing, routing.ReadAssignmentFromRoutes(routes, True)
@@ -0,0 +1,158 @@
+"""
+Knit Anemia Route Optimisation - Profiling
+Description :
+    lightweight instrumentation of one run : wall time of each stage (data load, formulator,
+    evaluator precompute, model build, first solution, local search, printing), number of calls of the
+    python evaluators, solver status and search statistics, written as one json report per run
+    the whole run can also be recorded with cProfile, the .prof file opens in snakeviz, gprof2dot
+    or flameprof for a flamegraph
+Shorcomings :
+    evaluator calls and model builds happening in other processes (portfolio, decompose) are not counted
+Errors :
+    NONE
+"""
+from __future__ import print_function
+import collections
+import contextlib
+import cProfile
+import io
+import json
+import timeit
+from knit_bounds import gap
+
+
+# RoutingModel.status() values
+ROUTING_STATUS = {0: 'ROUTING_NOT_SOLVED', 1: 'ROUTING_SUCCESS', 2: 'ROUTING_FAIL',
+                  3: 'ROUTING_FAIL_TIMEOUT', 4: 'ROUTING_INVALID'}
+# report field : solver method
+SEARCH_STATS = collections.OrderedDict([
+    ('branches', 'Branches'), ('failures', 'Failures'), ('solutions', 'Solutions'),
+    ('wall_time_ms', 'WallTime'), ('accepted_neighbors', 'AcceptedNeighbors'),
+    ('filtered_neighbors', 'FilteredNeighbors')])
+
+
+class CallCounter(object):
+    """Counts the calls of a function"""
+    def __init__(self, function):
+        """Initializes the counter"""
+        self._function = function
+        self.calls = 0
+
+    def __call__(self, *args):
+        """Calls the function"""
+        self.calls += 1
+        return self._function(*args)
+
+
+class StageTimer(object):
+    """Adds the time spent in a function to a stage of a profile"""
+    def __init__(self, profile, name, function):
+        """Initializes the timer"""
+        self._profile = profile
+        self._name = name
+        self._function = function
+
+    def __call__(self, *args, **kwargs):
+        """Calls the function"""
+        with self._profile.stage(self._name):
+            return self._function(*args, **kwargs)
+
+
+class Profile(object):
+    """Collects the stage times, evaluator calls and search statistics of a run"""
+    def __init__(self):
+        """Initializes an empty profile"""
+        self._start = timeit.default_timer()
+        self._stages = collections.OrderedDict()
+        self._counters = collections.OrderedDict()
+        self._solutions = []
+        self._search = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Adds the time spent in the with block to the stage"""
+        start = timeit.default_timer()
+        try:
+            yield
+        finally:
+            self._stages[name] = self._stages.get(name, 0.0) + timeit.default_timer() - start
+
+    def timed(self, name, function):
+        """Gets the function adding the time of each call to the stage"""
+        return StageTimer(self, name, function)
+
+    def count_calls(self, evaluator, name):
+        """Counts the calls of the evaluator method, to be done before the model is built"""
+        counter = CallCounter(getattr(evaluator, name))
+        setattr(evaluator, name, counter)
+        self._counters[name] = counter
+        return counter
+
+    def sink(self, sink=None):
+        """Gets a solution sink recording when each improving solution was found, then passing it on"""
+        def record(solution):
+            """Records one solution"""
+            self._solutions.append((solution['elapsed'], solution['cost']))
+            if sink:
+                sink(solution)
+        return record
+
+    def record_search(self, routing, assignment):
+        """Records the solver status and search statistics of the last solve"""
+        self._search = {'found': assignment is not None}
+        if assignment is not None:
+            self._search['objective'] = assignment.ObjectiveValue()
+        if routing is None:
+            return
+        if hasattr(routing, 'status'):
+            status = routing.status()
+            self._search['status'] = ROUTING_STATUS.get(status, status)
+        solver = routing.solver()
+        for field, method in SEARCH_STATS.items():
+            if hasattr(solver, method):
+                self._search[field] = getattr(solver, method)()
+
+    def record_gap(self, bounds, cost):
+        """Records the lower bounds of the problem (a knit_bounds.Bounds) and the gap of the cost"""
+        self._search.update(vehicle_bound=bounds.vehicles, cost_bound=bounds.cost,
+                            gap=round(gap(cost, bounds.cost), 4))
+
+    def report(self):
+        """Gets the report of the run"""
+        stages = collections.OrderedDict(
+            (name, round(seconds, 4)) for name, seconds in self._stages.items())
+        if 'solve' in self._stages:
+            search = self._stages['solve'] - self._stages.get('model build', 0.0)
+            stages['search'] = round(search, 4)
+            if self._solutions:
+                # elapsed is counted from the start of the last solve
+                stages['first solution'] = round(self._solutions[0][0], 4)
+                stages['local search'] = round(max(search - self._solutions[0][0], 0.0), 4)
+        return collections.OrderedDict([
+            ('total_s', round(timeit.default_timer() - self._start, 4)),
+            ('stages', stages),
+            ('calls', collections.OrderedDict(
+                (name, counter.calls) for name, counter in self._counters.items())),
+            ('search', self._search),
+            ('improvements', [{'elapsed': elapsed, 'cost': cost}
+                              for elapsed, cost in self._solutions])])
+
+    def write(self, path):
+        """Writes the report as json"""
+        with io.open(path, 'w') as f:
+            f.write(json.dumps(self.report(), indent=1))
+
+
+@contextlib.contextmanager
+def profiled(path=None):
+    """Records the with block with cProfile into path, does nothing without a path"""
+    if not path:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
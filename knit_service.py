@@ -0,0 +1,277 @@
+"""
+Knit Anemia Route Optimisation - Routing Service
+Description :
+    long running service answering solve requests over http (POST /solve) or json lines on stdin
+    solves run in a pool of worker processes that keep the loaded datasets and the model builders
+    (time evaluator included) of recent requests in memory, so repeated requests skip all loading
+    requests beyond the queue size are refused (503), requests past their deadline get a 504
+    the queue counts the solves the workers have not finished, a request answered 504 still holds its
+    place until its worker is free, and the time a request waited and was built in is taken off its
+    solver time limit
+Request :
+    {"dataset": "default", "capacity": 12000, "demands": {"3": 500},
+     "time_windows": [[0, 12000], ...], "time_limit_ms": 5000, "deadline_ms": 10000}
+    only the dataset is required, demands override the demand of single villages
+Usage :
+    python knit_service.py serve [--port=8080] [--workers=N] [--datasets=datasets.json]
+    python knit_service.py stdin [--workers=N] [--datasets=datasets.json]
+    python knit_service.py client request.json [--port=8080]
+Shorcomings :
+    python 3 only (asyncio)
+Errors :
+    NONE
+"""
+from __future__ import print_function
+import asyncio
+import collections
+import concurrent.futures
+import http.client
+import io
+import json
+import os
+import sys
+import time
+from knit_data import load_demands, load_matrix
+from knit_engine import CreateTimeEvaluator, DataProblem, command_line_value, model_builder
+from knit_engine import search_parameters
+
+
+DATASETS = {'default': {'demands': 'test_demands1.csv', 'matrix': 'travel_times.csv'}}
+CAPACITY = 12000
+PORT = 8080
+QUEUE_SIZE = 32
+DEADLINE_MS = 60000
+# time kept between the solver time limit and the request deadline to build and answer
+DEADLINE_MARGIN_MS = 2000
+BUILDER_CACHE_SIZE = 8
+
+
+##########
+# Worker #
+##########
+_datasets = {}
+_loaded = {}
+_builders = collections.OrderedDict()
+
+
+def init_worker(datasets):
+    """Remembers where the datasets are, they are loaded on first use, and sends what the worker
+    prints to stderr, stdout carrying the json lines answers in stdin mode"""
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+    _datasets.update(datasets)
+
+
+def dataset(name):
+    """Gets the demands and the travel time matrix of a dataset, loaded once per worker"""
+    if name not in _loaded:
+        if name not in _datasets:
+            raise KeyError('unknown dataset {0}'.format(name))
+        paths = _datasets[name]
+        _loaded[name] = (load_demands(paths['demands'], paths.get('demand_column', 5)),
+                         load_matrix(paths['matrix']))
+    return _loaded[name]
+
+
+def model_for(request):
+    """Gets the formulated problem, its model builder and the total times it costs arcs with,
+    reused for identical requests"""
+    key = json.dumps([request['dataset'], request.get('capacity', CAPACITY),
+                      sorted(request.get('demands', {}).items()), request.get('time_windows')])
+    if key in _builders:
+        _builders.move_to_end(key)
+        return _builders[key]
+    demands, distances = dataset(request['dataset'])
+    demands = demands.copy()
+    for village, demand in request.get('demands', {}).items():
+        demands[int(village)] = demand
+    data = DataProblem(demands, distances, request.get('capacity', CAPACITY),
+                       request.get('time_windows'))
+    data.formulator()
+    time_evaluator = CreateTimeEvaluator(data)
+    _builders[key] = (data, model_builder(data, time_evaluator=time_evaluator),
+                      time_evaluator.total_time)
+    if len(_builders) > BUILDER_CACHE_SIZE:
+        _builders.popitem(last=False)
+    return _builders[key]
+
+
+def solve_request(request, deadline=None):
+    """Solves one request in a worker process, returns the json answer
+
+    deadline (a time.time()) bounds the solver time limit by what is left of it, less the margin
+    """
+    from knit_solver import extract_routes, solve_with_growing_fleet
+    start = time.time()
+    data, build, total_time = model_for(request)
+    time_limit_ms = request.get('time_limit_ms')
+    if deadline is not None:
+        left_ms = int((deadline - time.time()) * 1000) - DEADLINE_MARGIN_MS
+        if left_ms <= 0:
+            raise TimeoutError('deadline reached before the solve started')
+        time_limit_ms = min(time_limit_ms or left_ms, left_ms)
+    routing, assignment = solve_with_growing_fleet(data, build, search_parameters(time_limit_ms),
+                                                   total_time=total_time)
+    answer = {'dedicated': [{'vehicle': int(route['vehicle']), 'village': int(route['village']),
+                             'load': int(route['load'])} for route in data.dedicated_routes]}
+    if assignment is None:
+        answer.update(routes=None, cost=None, vehicles=None)
+    else:
+        routes = [route for route in extract_routes(routing, assignment) if route]
+        answer.update(routes=routes, cost=assignment.ObjectiveValue(),
+                      vehicles=data.req_vehicles + len(routes))
+    answer['elapsed'] = round(time.time() - start, 3)
+    return answer
+
+
+###########
+# Service #
+###########
+class RoutingService(object):
+    """Queues solve requests onto the worker pool with a deadline each"""
+    def __init__(self, datasets=None, workers=None, queue_size=QUEUE_SIZE):
+        """Initializes the worker pool"""
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=init_worker, initargs=(datasets or DATASETS,))
+        self._queue_size = queue_size
+        # executor futures of the requests queued or solving
+        self._in_flight = set()
+
+    @property
+    def pending(self):
+        """Gets the number of requests the workers have not finished"""
+        return len(self._in_flight)
+
+    async def solve(self, request):
+        """Solves a request, returns (http status, json answer)"""
+        if self.pending >= self._queue_size:
+            return 503, {'error': 'too many pending requests'}
+        if 'dataset' not in request:
+            return 400, {'error': 'missing dataset'}
+        deadline_ms = request.get('deadline_ms', DEADLINE_MS)
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._executor.submit(solve_request, request, time.time() + deadline_ms / 1000.0)
+            self._in_flight.add(future)
+            future.add_done_callback(
+                lambda done: loop.call_soon_threadsafe(self._in_flight.discard, done))
+            return 200, await asyncio.wait_for(asyncio.wrap_future(future), deadline_ms / 1000.0)
+        except (asyncio.TimeoutError, TimeoutError):
+            # a queued solve never starts, a running one stays in flight until its time limit
+            future.cancel()
+            return 504, {'error': 'deadline of {0}ms exceeded'.format(deadline_ms)}
+        except (KeyError, ValueError, TypeError) as error:
+            return 400, {'error': str(error)}
+        except Exception as error:  # pylint: disable=broad-except
+            # the service outlives any single failing solve
+            return 500, {'error': '{0}: {1}'.format(type(error).__name__, error)}
+
+    async def handle_http(self, reader, writer):
+        """Answers one http connection"""
+        try:
+            method, path, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1')
+                if not line.strip():
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            if method == 'GET' and path == '/health':
+                status, answer = 200, {'pending': self.pending}
+            elif method == 'POST' and path == '/solve':
+                status, answer = await self.solve(json.loads(body.decode('utf-8')))
+            else:
+                status, answer = 404, {'error': 'no {0} {1}'.format(method, path)}
+        except ValueError as error:
+            status, answer = 400, {'error': str(error)}
+        payload = json.dumps(answer).encode('utf-8')
+        writer.write('HTTP/1.1 {0} {1}\r\nContent-Type: application/json\r\n'
+                     'Content-Length: {2}\r\nConnection: close\r\n\r\n'.format(
+                         status, http.client.responses.get(status, ''), len(payload)
+                     ).encode('latin-1') + payload)
+        await writer.drain()
+        writer.close()
+
+    async def serve_http(self, port=PORT, host='127.0.0.1'):
+        """Serves http requests until cancelled"""
+        server = await asyncio.start_server(self.handle_http, host, port)
+        print('serving on http://{0}:{1}'.format(host, port))
+        async with server:
+            await server.serve_forever()
+
+    async def serve_stdin(self):
+        """Answers one json request per stdin line with one json line on stdout, in completion order"""
+        loop = asyncio.get_running_loop()
+        tasks = []
+
+        async def answer(line):
+            """Solves the request of one line and prints the answer"""
+            try:
+                request = json.loads(line)
+            except ValueError as error:
+                status, result, request = 400, {'error': str(error)}, {}
+            else:
+                status, result = await self.solve(request)
+            print(json.dumps({'id': request.get('id'), 'status': status, 'result': result}))
+            sys.stdout.flush()
+
+        while True:
+            line = await loop.run_in_executor(None, sys.stdin.readline)
+            if not line:
+                break
+            if line.strip():
+                tasks.append(asyncio.ensure_future(answer(line)))
+        await asyncio.gather(*tasks)
+
+    def close(self):
+        """Stops the worker pool, dropping the queued solves and waiting for the running ones"""
+        for future in list(self._in_flight):
+            future.cancel()
+        self._executor.shutdown(wait=True)
+
+
+##########
+# Client #
+##########
+def post_solve(request, port=PORT, host='127.0.0.1', timeout=None):
+    """Sends a solve request to a running service, returns (http status, json answer)"""
+    connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        connection.request('POST', '/solve', json.dumps(request),
+                           {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read().decode('utf-8'))
+    finally:
+        connection.close()
+
+
+def main(argv):
+    """Runs the service or the client"""
+    mode = argv[0] if argv else 'serve'
+    port = int(command_line_value('port', PORT, argv))
+    if mode == 'client':
+        with io.open(argv[1]) as f:
+            print(post_solve(json.load(f), port))
+        return
+    datasets = DATASETS
+    if command_line_value('datasets', None, argv):
+        with io.open(command_line_value('datasets', None, argv)) as f:
+            datasets = json.load(f)
+    workers = command_line_value('workers', None, argv)
+    service = RoutingService(datasets, workers and int(workers))
+    try:
+        if mode == 'serve':
+            asyncio.run(service.serve_http(port))
+        elif mode == 'stdin':
+            asyncio.run(service.serve_stdin())
+        else:
+            raise ValueError('unknown mode {0}'.format(mode))
+    finally:
+        service.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,151 @@
+"""
+Knit Anemia Route Optimisation - Time Dependent Travel Times
+Description :
+    travel times that change over the day (market days, monsoon roads) as time slices : one travel time
+    matrix per slice, stored together as one contiguous slices x n x n int32 array, slice s applying
+    from starts[s] until the next slice starts
+    the slice of a departure time is read in O(1) from a step function table precomputed once with
+    one entry per step (the gcd of the slice starts) up to the horizon, so the table grows with the
+    horizon and not with the number of locations (beyond MAX_STEPS entries lookups binary search)
+    the routing model keeps one static transit matrix : an arc i -> j costs the service time of i plus
+    the longest travel time to j over the slices i can be left in (its opening plus service up to
+    its closing plus service), so the model never reaches a location later than the roads would,
+    the real times of a route are then replayed slice by slice
+Shorcomings :
+    travel times are a step function of the departure time, no interpolation between slices
+Errors :
+    ValueError when the slices do not start at time 0 or do not match the number of locations
+"""
+from __future__ import print_function
+import numpy as np
+from knit_data import load_matrix
+from knit_matrix import TIME_DTYPE, read_only
+
+
+MAX_STEPS = 1 << 20
+
+
+class TimeSlices(object):
+    """Stores the travel time matrices of the slices of the day and the step function of their starts"""
+    __slots__ = ('_starts', '_travel', '_step', '_table')
+
+    def __init__(self, starts, travel, horizon, max_steps=MAX_STEPS):
+        """Initializes the slices from their start times and their stacked travel time matrices"""
+        starts = np.asarray(starts, dtype=np.int64)
+        travel = np.ascontiguousarray(travel, dtype=TIME_DTYPE)
+        if travel.ndim != 3 or travel.shape[1] != travel.shape[2]:
+            raise ValueError('time slices must be stacked square matrices, got shape {0}'.format(
+                travel.shape))
+        if starts.shape != (travel.shape[0],):
+            raise ValueError('{0} slice starts for {1} slices'.format(starts.size, travel.shape[0]))
+        if starts[0] != 0 or (np.diff(starts) <= 0).any():
+            raise ValueError('slice starts must increase from 0, got {0}'.format(starts.tolist()))
+        self._starts = read_only(starts)
+        self._travel = read_only(travel)
+        horizon = max(int(horizon), int(starts[-1]))
+        self._step = int(np.gcd.reduce(starts[1:])) if starts.size > 1 else horizon + 1
+        steps = horizon // self._step + 1
+        self._table = None
+        if steps <= max_steps:
+            self._table = read_only(self._search(np.arange(steps, dtype=np.int64) * self._step).astype(
+                np.min_scalar_type(starts.size - 1)))
+
+    @property
+    def starts(self):
+        """Gets the time each slice starts"""
+        return self._starts
+
+    @property
+    def travel(self):
+        """Gets the slices x n x n travel times"""
+        return self._travel
+
+    @property
+    def shape(self):
+        """Gets the shape of one travel time matrix"""
+        return self._travel.shape[1:]
+
+    @property
+    def nbytes(self):
+        """Gets the memory used by the travel times and the step function table"""
+        return self._travel.nbytes + (0 if self._table is None else self._table.nbytes)
+
+    def _search(self, departures):
+        """Gets the slice of departure times by binary search"""
+        return np.searchsorted(self._starts, departures, side='right') - 1
+
+    def slices_at(self, departures):
+        """Gets the slice of every departure time"""
+        departures = np.asarray(departures, dtype=np.int64)
+        if self._table is None:
+            return self._search(departures)
+        return self._table[np.clip(departures // self._step, 0, self._table.size - 1)].astype(np.intp)
+
+    def slice_at(self, departure):
+        """Gets the slice of a departure time"""
+        if self._table is None:
+            return int(self._search(departure))
+        return int(self._table[min(max(int(departure), 0) // self._step, self._table.size - 1)])
+
+    def travel_time(self, from_node, to_node, departure):
+        """Gets the travel time between two locations leaving at departure"""
+        return int(self._travel[self.slice_at(departure), from_node, to_node])
+
+    def slowest(self):
+        """Gets the longest travel time of the day between every pair of locations"""
+        return self._travel.max(axis=0)
+
+    def longest(self, earliest, latest, rows=None):
+        """Gets the longest travel time from every location (or every location of rows) over the slices
+        it can be left in, between its earliest and latest departure"""
+        rows = np.arange(self.shape[0]) if rows is None else np.asarray(rows, dtype=np.intp)
+        first, last = self.slices_at(earliest), self.slices_at(latest)
+        longest = np.zeros((rows.size, self.shape[1]), dtype=TIME_DTYPE)
+        for slice_id in range(self._travel.shape[0]):
+            left = np.flatnonzero((first <= slice_id) & (slice_id <= last))
+            if left.size:
+                longest[left] = np.maximum(longest[left], self._travel[slice_id, rows[left]])
+        return longest
+
+    def schedule(self, path, demands, start=0, opens=None):
+        """Gets the time each location of a path is reached, leaving every location right after its
+        service and waiting at the next one until it opens"""
+        times = [int(start)]
+        for from_node, to_node in zip(path[:-1], path[1:]):
+            departure = times[-1] + int(demands[from_node])
+            reached = departure + self.travel_time(from_node, to_node, departure)
+            if opens is not None:
+                reached = max(reached, int(opens[to_node]))
+            times.append(reached)
+        return times
+
+
+def departure_range(demands, capacity, time_windows=None):
+    """Gets the earliest and latest time every location can be left, after its service"""
+    demands = np.asarray(demands, dtype=np.int64)
+    if time_windows is None:
+        return demands, np.full(demands.size, capacity, dtype=np.int64)
+    windows = np.asarray(time_windows, dtype=np.int64)
+    return windows[:, 0] + demands, np.minimum(windows[:, 1] + demands, capacity)
+
+
+def replay_stops(stops, time_slices, demands, opens=None):
+    """Gets a copy of route stops (see knit_output.ROUTE_STOP) with the times the roads really give"""
+    stops = stops.copy()
+    vehicles = stops['vehicle']
+    for bounds in np.split(np.arange(vehicles.size), np.flatnonzero(np.diff(vehicles)) + 1):
+        if bounds.size:
+            path = stops['node'][bounds]
+            stops['cumul'][bounds] = time_slices.schedule(
+                path.tolist(), demands, stops['cumul'][bounds[0]], opens)
+    return stops
+
+
+def load_time_slices(slices, horizon):
+    """Loads time slices given as (start, matrix csv) pairs, each matrix memory mapped from its
+    sidecar then copied into the contiguous slices array"""
+    starts, paths = zip(*sorted(slices))
+    travel = np.empty((len(paths),) + load_matrix(paths[0]).shape, dtype=TIME_DTYPE)
+    for slice_id, path in enumerate(paths):
+        travel[slice_id] = load_matrix(path)
+    return TimeSlices(starts, travel, horizon)
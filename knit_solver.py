@@ -0,0 +1,314 @@
+"""
+Knit Anemia Route Optimisation - Solver Setup
+Description :
+    hands the precomputed matrices to the routing model so the search loop does not call back into python
+    dimensions are registered as matrix dimensions when the ortools wrapper exposes them,
+    everything else goes through evaluators that the solver caches on the C++ side
+    (max_callback_cache_size), so each arc enters python at most once
+    use_callbacks=True keeps the old per arc python callbacks for comparison
+Errors :
+    ValueError when vehicles of several speeds meet an ortools without RegisterTransitCallback
+"""
+from __future__ import print_function
+from six.moves import xrange
+import io
+import json
+import time
+import numpy as np
+from ortools.constraint_solver import pywrapcp
+from knit_bounds import fleet_lower_bound
+
+
+# time limits from here on mean no limit (the default search parameters hold the largest int64)
+UNLIMITED_MS = 1 << 62
+
+
+def model_parameters(num_locations, use_callbacks=False):
+    """Gets the routing model parameters"""
+    parameters = pywrapcp.RoutingModel.DefaultModelParameters()
+    if use_callbacks:
+        # never cache, every evaluation goes back to python
+        parameters.max_callback_cache_size = 0
+    else:
+        parameters.max_callback_cache_size = max(
+            parameters.max_callback_cache_size, num_locations)
+    return parameters
+
+
+def create_routing_model(data, num_vehicles=None, use_callbacks=False):
+    """Creates the routing model, with explicit start and end locations if the data has them"""
+    if num_vehicles is None:
+        num_vehicles = data.num_vehicles
+    parameters = model_parameters(data.num_locations, use_callbacks)
+    if getattr(data, 'start_locations', None) is not None:
+        return pywrapcp.RoutingModel(
+            data.num_locations, num_vehicles,
+            data.start_locations[:num_vehicles], data.end_locations[:num_vehicles], parameters)
+    return pywrapcp.RoutingModel(data.num_locations, num_vehicles, data.depot, parameters)
+
+
+def set_arc_costs(routing, evaluator):
+    """Sets the evaluator of the cost of each arc for every vehicle, its caching being set by the
+    model parameters (see model_parameters)"""
+    routing.SetArcCostEvaluatorOfAllVehicles(evaluator)
+
+
+def register_evaluators(routing, evaluators):
+    """Gets the callback of each evaluator, one per distinct evaluator, so the solver keys its cost
+    classes by speed and not by vehicle : a callback index once RegisterTransitCallback exists,
+    the evaluator itself with the older ortools taking evaluators directly"""
+    if not hasattr(routing, 'RegisterTransitCallback'):
+        return list(evaluators)
+    registered = {}
+    callbacks = []
+    for evaluator in evaluators:
+        if id(evaluator) not in registered:
+            registered[id(evaluator)] = routing.RegisterTransitCallback(evaluator)
+        callbacks.append(registered[id(evaluator)])
+    return callbacks
+
+
+def check_speed_classes(num_speeds):
+    """Refuses vehicles of several speeds on ortools taking evaluators directly, which wrap and cache
+    every evaluator passed once per vehicle"""
+    if num_speeds > 1 and not hasattr(pywrapcp.RoutingModel, 'RegisterTransitCallback'):
+        raise ValueError('vehicles of several speeds need an ortools with RegisterTransitCallback')
+
+
+def shared_callback(callbacks):
+    """Gets the callback every vehicle shares, None when the vehicles have several"""
+    return callbacks[0] if len(set(id(callback) for callback in callbacks)) == 1 else None
+
+
+def set_vehicle_costs(routing, evaluators, fixed_costs):
+    """Sets the arc cost evaluator and the fixed cost of each vehicle, returns the callback of each
+    vehicle for its dimensions (see register_evaluators)"""
+    callbacks = register_evaluators(routing, evaluators)
+    shared = shared_callback(callbacks)
+    if shared is not None:
+        routing.SetArcCostEvaluatorOfAllVehicles(shared)
+    else:
+        check_speed_classes(len(set(id(callback) for callback in callbacks)))
+        for vehicle_id, callback in enumerate(callbacks):
+            routing.SetArcCostEvaluatorOfVehicle(callback, vehicle_id)
+    for vehicle_id, fixed_cost in enumerate(fixed_costs):
+        routing.SetFixedCostOfVehicle(int(fixed_cost), vehicle_id)
+    return callbacks
+
+
+def add_vehicle_dimension(routing, callbacks, slack_max, capacities, name):
+    """Adds a dimension with the transit callback (see register_evaluators) and the capacity of
+    each vehicle, one callback for all of them when they share it"""
+    capacities = [int(capacity) for capacity in capacities]
+    shared = shared_callback(callbacks)
+    if shared is not None:
+        return routing.AddDimensionWithVehicleCapacity(shared, slack_max, capacities, True, name)
+    return routing.AddDimensionWithVehicleTransitAndCapacity(
+        list(callbacks), slack_max, capacities, True, name)
+
+
+def add_matrix_dimension(routing, matrix, evaluator, slack_max, capacity, name,
+                         use_callbacks=False):
+    """Adds a dimension whose transit between two nodes is read from the matrix"""
+    if not use_callbacks and slack_max == 0 and hasattr(routing, 'AddMatrixDimension'):
+        return routing.AddMatrixDimension(
+            np.asarray(matrix).tolist(), capacity, True, name)
+    return routing.AddDimension(evaluator, slack_max, capacity, True, name)
+
+
+def restrict_arcs(routing, neighbours):
+    """Lets each village only be followed by its candidate neighbours or by the end of a route
+
+    neighbours holds one row of candidate nodes per node, see knit_matrix.nearest_neighbours
+    vehicle starts keep every arc so a route can begin anywhere,
+    every node keeps itself so it can still be left out of the routes (see exclude_nodes)
+    """
+    ends = [routing.End(vehicle_id) for vehicle_id in xrange(routing.vehicles())]
+    starts = set(routing.Start(vehicle_id) for vehicle_id in xrange(routing.vehicles()))
+    for index in xrange(routing.Size()):
+        if index in starts:
+            continue
+        allowed = [routing.NodeToIndex(node) for node in neighbours[routing.IndexToNode(index)]]
+        # nodes that are vehicle starts have no index of their own to go to
+        routing.NextVar(index).SetValues(
+            [value for value in allowed if value >= 0 and value not in starts] + ends + [index])
+
+
+def remove_arcs(routing, arcs):
+    """Removes the successors a node can never go to, arcs[i, j] is False when i can never go to j"""
+    node_index = np.array([routing.NodeToIndex(node) for node in xrange(arcs.shape[0])])
+    starts = set(routing.Start(vehicle_id) for vehicle_id in xrange(routing.vehicles()))
+    ends = [(routing.End(vehicle_id), routing.IndexToNode(routing.End(vehicle_id)))
+            for vehicle_id in xrange(routing.vehicles())]
+    for index in xrange(routing.Size()):
+        if index in starts:
+            continue
+        node = routing.IndexToNode(index)
+        # a node pointing to itself is left out of the routes, that must stay possible
+        removed = [int(value) for value in node_index[~arcs[node]] if value >= 0 and value != index]
+        removed += [end for end, end_node in ends if not arcs[node, end_node]]
+        if removed:
+            routing.NextVar(index).RemoveValues(removed)
+
+
+def exclude_nodes(routing, nodes):
+    """Leaves the nodes out of every route"""
+    for node in nodes:
+        index = routing.NodeToIndex(int(node))
+        routing.AddDisjunction([index], 0)
+        routing.ActiveVar(index).SetValue(0)
+
+
+##############
+# Fleet Size #
+##############
+def solve_with_growing_fleet(data, build_model, search_parameters, max_vehicles=None, step=1,
+                             sink=None, total_time=None):
+    """Solves with the lower bound fleet first, then with at least step more vehicles, doubling
+    the fleet while no solution is found, with every vehicle at once for a mixed fleet
+
+    build_model(num_vehicles) returns a routing model with every constraint added
+    total_time, the matrix build_model costs arcs with, saves recomputing it for the lower bound
+    sink, if given, receives every improving solution while the solver runs
+    the time limit of the search parameters bounds all the attempts together, not each of them
+    returns the routing model and the assignment, None if even max_vehicles is infeasible
+    or the time limit ran out first
+    """
+    if max_vehicles is None:
+        max_vehicles = data.num_vehicles
+    if getattr(data, 'fleet', None) is not None:
+        # every vehicle is offered, the fixed costs and speeds choose which ones are used
+        num_vehicles = max_vehicles
+    else:
+        num_vehicles = min(max(1, fleet_lower_bound(data, total_time=total_time)), max_vehicles)
+    deadline = search_deadline(search_parameters)
+    while True:
+        routing = build_model(num_vehicles)
+        # the stream is referenced here for as long as the solver may call it
+        stream = SolutionStream(routing, sink).attach() if sink else None
+        assignment = routing.SolveWithParameters(remaining_time(search_parameters, deadline))
+        if assignment is not None or num_vehicles >= max_vehicles:
+            return routing, assignment
+        if deadline is not None and time.time() >= deadline:
+            return routing, None
+        # an infeasible instance takes log(max_vehicles) rebuilds, not max_vehicles
+        num_vehicles = min(max(num_vehicles + step, 2 * num_vehicles), max_vehicles)
+
+
+##########
+# Routes #
+##########
+def extract_routes(routing, assignment):
+    """Gets the nodes visited by each vehicle, start and end excluded"""
+    routes = []
+    for vehicle_id in xrange(routing.vehicles()):
+        route = []
+        index = assignment.Value(routing.NextVar(routing.Start(vehicle_id)))
+        while not routing.IsEnd(index):
+            route.append(routing.IndexToNode(index))
+            index = assignment.Value(routing.NextVar(index))
+        routes.append(route)
+    return routes
+
+
+def routes_cost(matrix, routes, depot=0):
+    """Gets the total arc cost of routes leaving from and returning to the depot"""
+    matrix = np.asarray(matrix)
+    cost = 0
+    for route in routes:
+        if route:
+            path = np.concatenate(([depot], route, [depot])).astype(np.intp)
+            cost += int(matrix[path[:-1], path[1:]].sum())
+    return cost
+
+
+##########
+# Limits #
+##########
+def limit_search(search_parameters, time_limit_ms=None, solution_limit=None):
+    """Bounds the search in wall clock time and in number of solutions"""
+    if time_limit_ms:
+        search_parameters.time_limit_ms = int(time_limit_ms)
+    if solution_limit:
+        search_parameters.solution_limit = int(solution_limit)
+    return search_parameters
+
+
+def search_deadline(search_parameters):
+    """Gets the wall clock time the search parameters' time limit ends at, None without a limit"""
+    time_limit_ms = int(getattr(search_parameters, 'time_limit_ms', 0) or 0)
+    if not 0 < time_limit_ms < UNLIMITED_MS:
+        return None
+    return time.time() + time_limit_ms / 1000.0
+
+
+def remaining_time(search_parameters, deadline):
+    """Gets a copy of the search parameters limited to the time left before the deadline"""
+    if deadline is None:
+        return search_parameters
+    parameters = type(search_parameters)()
+    parameters.CopyFrom(search_parameters)
+    parameters.time_limit_ms = max(1, int((deadline - time.time()) * 1000))
+    return parameters
+
+
+#############
+# Streaming #
+#############
+class SolutionStream(object):
+    """Sends every improving solution of a routing model to a sink while the solver runs"""
+    def __init__(self, routing, sink):
+        """Initializes the stream"""
+        self._routing = routing
+        self._sink = sink
+        self._start = time.time()
+        self._best = None
+
+    @property
+    def best(self):
+        """Gets the best solution streamed so far"""
+        return self._best
+
+    def attach(self):
+        """Registers the stream as an at solution callback of the routing model"""
+        self._routing.AddAtSolutionCallback(self)
+        return self
+
+    def __call__(self):
+        """Streams the current solution if it improves on the best one"""
+        cost = self._routing.CostVar().Value()
+        if self._best is not None and cost >= self._best['cost']:
+            return
+        routes = []
+        for vehicle_id in xrange(self._routing.vehicles()):
+            route = []
+            index = self._routing.NextVar(self._routing.Start(vehicle_id)).Value()
+            while not self._routing.IsEnd(index):
+                route.append(self._routing.IndexToNode(index))
+                index = self._routing.NextVar(index).Value()
+            if route:
+                routes.append(route)
+        self._best = {'cost': cost, 'vehicles': len(routes),
+                      'elapsed': round(time.time() - self._start, 3), 'routes': routes}
+        self._sink(self._best)
+
+
+def print_solution(solution):
+    """Prints a streamed solution on console"""
+    print('solution : cost {cost}, {vehicles} vehicles, after {elapsed}s'.format(**solution))
+
+
+class JsonLinesSink(object):
+    """Appends every streamed solution to a json lines file, flushed as it comes"""
+    def __init__(self, path):
+        """Opens the file"""
+        self._file = io.open(path, 'a')
+
+    def __call__(self, solution):
+        """Writes one solution"""
+        self._file.write(json.dumps(solution) + '\n')
+        self._file.flush()
+
+    def close(self):
+        """Closes the file"""
+        self._file.close()
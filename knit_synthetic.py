@@ -0,0 +1,42 @@
+"""
+Knit Anemia Route Optimisation - Synthetic Instances
+Description :
+    reproducible random problems, built as the knit_engine.DataProblem the scripts solve
+    villages are scattered on a square around a central depot, travel times follow the straight line
+    distance, demands are service times and every village gets a time window unless time_windows=False
+Errors :
+    NONE
+"""
+from __future__ import print_function
+import numpy as np
+from knit_engine import DataProblem
+
+
+SIDE = 100.0
+MINUTES_PER_UNIT = 3.0
+MAX_DEMAND = 300
+CAPACITY = 2000
+
+
+def synthetic_problem(num_locations, seed=0, capacity=CAPACITY, time_windows=True,
+                      start_locations=None):
+    """Gets a random problem, the same seed always gives the same problem"""
+    rng = np.random.RandomState(seed)
+    depot = 0
+    coordinates = rng.uniform(0, SIDE, size=(num_locations, 2))
+    coordinates[depot] = SIDE / 2
+    gaps = coordinates[:, np.newaxis, :] - coordinates[np.newaxis, :, :]
+    distances = np.rint(np.sqrt((gaps ** 2).sum(axis=2)) * MINUTES_PER_UNIT).astype(np.int32)
+    demands = rng.randint(10, MAX_DEMAND, size=num_locations)
+    demands[depot] = 0
+    opens = rng.randint(0, capacity // 2, size=num_locations)
+    windows = np.stack((opens, opens + capacity // 2), axis=1)
+    windows[depot] = (0, capacity)
+    return DataProblem(demands, distances, capacity, windows if time_windows else None,
+                       start_locations, coordinates=coordinates, depot=depot)
+
+
+def synthetic_start_problem(num_locations, seed=0, capacity=CAPACITY, time_windows=True):
+    """Gets a random problem whose first vehicle starts from a village instead of the depot"""
+    return synthetic_problem(num_locations, seed, capacity, time_windows,
+                             start_locations=[min(1, num_locations - 1)])
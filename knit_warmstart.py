@@ -0,0 +1,140 @@
+"""
+Knit Anemia Route Optimisation - Warm Start
+Description :
+    saves the routes of a solution and starts the next solve from them instead of from scratch,
+    one file per problem family (knit_cache.problem_keys : same matrix, capacity or fleet, windows and
+    locations), so solving another dataset neither overwrites nor reuses them, in a directory bounded
+    in bytes like the solution cache, the least recently used routes being evicted first
+    the saved routes are repaired first, on the total times the model costs arcs with : villages that
+    disappeared or that the time windows rule out are dropped and new villages are inserted where they
+    add the least time without exceeding the vehicle capacity
+    what-if re-solves patch only the villages whose demand changed (formulator and total time rows)
+    and start from the current routes
+Errors :
+    NONE
+"""
+from __future__ import print_function
+import io
+import json
+import os
+import numpy as np
+from knit_cache import SolutionCache
+from knit_matrix import total_time_matrix
+from knit_solver import SolutionStream, solve_with_growing_fleet
+
+
+ROUTES_DIR = '.knit_routes'
+ROUTES_MAX_BYTES = 8 << 20
+
+
+def routes_file(family, path=ROUTES_DIR):
+    """Gets the file the routes of a problem family are saved to"""
+    return os.path.join(path, '{0}.json'.format(family))
+
+
+def save_routes(path, routes, max_bytes=ROUTES_MAX_BYTES):
+    """Saves the node sequence of every used vehicle, then evicts the least recently used routes
+    of the directory beyond max_bytes"""
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    # a run stopped while writing leaves the previous routes intact
+    tmp_path = path + '.tmp'
+    with io.open(tmp_path, 'w') as f:
+        f.write(json.dumps({'routes': routes}))
+    os.replace(tmp_path, path)
+    if directory:
+        SolutionCache(directory, max_bytes).evict()
+    return routes
+
+
+def load_routes(path):
+    """Loads saved routes, None if there are none or they cannot be read"""
+    try:
+        with io.open(path) as f:
+            routes = json.load(f)['routes']
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return None
+    os.utime(path, None)
+    return routes
+
+
+def route_load(total_time, route, depot):
+    """Gets what a route adds up in the Capacity dimension"""
+    path = np.array([depot] + list(route) + [depot], dtype=np.intp)
+    return int(total_time[path[:-1], path[1:]].sum())
+
+
+def repair_routes(routes, total_time, capacity, depot=0, excluded=()):
+    """Fits the saved routes to the current villages"""
+    num_locations = total_time.shape[0]
+    excluded = set(excluded) | {depot}
+    seen = set()
+    repaired = []
+    for route in routes:
+        kept = []
+        for node in route:
+            if 0 <= node < num_locations and node not in excluded and node not in seen:
+                kept.append(node)
+                seen.add(node)
+        if kept:
+            repaired.append(kept)
+    loads = [route_load(total_time, route, depot) for route in repaired]
+    for node in range(num_locations):
+        if node in excluded or node in seen:
+            continue
+        best = None
+        for route_id, route in enumerate(repaired):
+            path = np.array([depot] + route + [depot], dtype=np.intp)
+            # extra time of the node between each pair of consecutive stops
+            extra = (total_time[path[:-1], node] + total_time[node, path[1:]] -
+                     total_time[path[:-1], path[1:]])
+            position = int(extra.argmin())
+            if loads[route_id] + extra[position] <= capacity and (
+                    best is None or extra[position] < best[0]):
+                best = (int(extra[position]), route_id, position)
+        if best is None:
+            repaired.append([node])
+            loads.append(route_load(total_time, [node], depot))
+        else:
+            extra, route_id, position = best
+            repaired[route_id].insert(position, node)
+            loads[route_id] += extra
+    return repaired
+
+
+def solve_warm(data, build_model, search_parameters, routes, sink=None, total_time=None,
+               pruning=None):
+    """Solves starting from the repaired routes, from scratch if they cannot be read as a solution
+
+    total_time is the matrix the model costs arcs with (see knit_engine.CreateTimeEvaluator),
+    pruning (a knit_feasibility.Pruning) drops the villages the time windows rule out
+    """
+    if total_time is None:
+        total_time = total_time_matrix(data.demands, data.distances)
+    excluded = (list(getattr(data, 'start_locations', None) or []) +
+                list(getattr(data, 'end_locations', None) or []))
+    if pruning is not None:
+        excluded += pruning.unreachable.tolist()
+    routes = repair_routes(routes, total_time, data.vehicle.capacity, data.depot, excluded)
+    if routes and len(routes) <= data.num_vehicles:
+        routing = build_model(len(routes))
+        assignment = routing.ReadAssignmentFromRoutes(routes, True)
+        if assignment is not None:
+            stream = SolutionStream(routing, sink).attach() if sink else None
+            return routing, routing.SolveFromAssignmentWithParameters(
+                assignment, search_parameters)
+    return solve_with_growing_fleet(data, build_model, search_parameters, sink=sink,
+                                    total_time=total_time)
+
+
+def solve_what_if(data, time_evaluator, build_model, search_parameters, demands, routes, sink=None):
+    """Re-solves after a few demand changes without rebuilding the problem
+
+    demands maps a village to its new raw demand, time_evaluator is the one shared with build_model,
+    which then prunes the time windows with the new total times
+    """
+    data.update_demands(demands)
+    time_evaluator.update_demands(data, sorted(demands))
+    return solve_warm(data, build_model, search_parameters, routes, sink,
+                      time_evaluator.total_time, time_evaluator.pruning(data))